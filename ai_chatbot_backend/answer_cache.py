@@ -0,0 +1,219 @@
+# answer_cache.py
+# 问答缓存：招生季大量用户会问相同的问题（如“通信工程学费是多少”），
+# 以“归一化问题 + 识别出的意图”为键缓存回答，命中时跳过 LLM 生成。
+# 键中带有知识库版本号，知识库增删改或重建索引时版本号递增，旧缓存随即失效。
+# 进程内后端的版本号只在本进程内递增，失效通知无法到达其他 worker；
+# 以多个 worker 运行（WEB_CONCURRENCY > 1）时必须使用 Redis 后端，否则问答缓存被禁用。
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple, Union
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+ANSWER_CACHE_BACKEND = os.getenv("ANSWER_CACHE_BACKEND", "memory")  # memory | redis
+ANSWER_CACHE_REDIS_URL = os.getenv("ANSWER_CACHE_REDIS_URL", "redis://localhost:6379/0")
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "2000"))
+# uvicorn/gunicorn 的 worker 进程数
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+
+_KEY_PREFIX = "answer_cache:"
+_VERSION_KEY = f"{_KEY_PREFIX}knowledge_version"
+_PUNCTUATION_PATTERN = re.compile(r'[\s，。！？；：、,.!?;:~～…“”"\'（）()《》【】\[\]-]+')
+_POLITE_PREFIX_PATTERN = re.compile(r'^(你好|您好|请问|想问一下|想问|问一下)+')
+
+
+def normalize_question(question: str) -> str:
+    """全角转半角、统一小写、去掉标点空白和“请问”等客套前缀"""
+    normalized = unicodedata.normalize("NFKC", question or "").lower()
+    normalized = _PUNCTUATION_PATTERN.sub("", normalized)
+    return _POLITE_PREFIX_PATTERN.sub("", normalized)
+
+
+class InMemoryCacheBackend:
+    """进程内 LRU + TTL 缓存，知识库版本号保存在进程内"""
+
+    def __init__(self, max_entries: int = ANSWER_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, ttl: int):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_version(self) -> int:
+        with self._lock:
+            return self._version
+
+    def bump_version(self) -> int:
+        with self._lock:
+            self._version += 1
+            # 旧版本的键不会再被访问，直接清空以释放内存
+            self._entries.clear()
+            return self._version
+
+    def size(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+class RedisCacheBackend:
+    """
+    Redis 兼容存储，多个 uvicorn worker 共享缓存和知识库版本号。
+    过期由键的 TTL 负责，容量淘汰依赖服务端配置 maxmemory-policy allkeys-lru。
+    """
+
+    def __init__(self, url: str = ANSWER_CACHE_REDIS_URL):
+        if redis is None:
+            raise RuntimeError("未安装 redis 包，无法使用 Redis 缓存后端。")
+        self._client = redis.Redis.from_url(url, decode_responses=True)
+        self._client.ping()
+
+    def get(self, key: str) -> Optional[str]:
+        return self._client.get(key)
+
+    def set(self, key: str, value: str, ttl: int):
+        self._client.set(key, value, ex=ttl)
+
+    def get_version(self) -> int:
+        return int(self._client.get(_VERSION_KEY) or 0)
+
+    def bump_version(self) -> int:
+        return int(self._client.incr(_VERSION_KEY))
+
+    def size(self) -> Optional[int]:
+        return None
+
+
+class AnswerCache:
+    """问答缓存，后端可替换；backend 为 None 时缓存被禁用。后端出错时视为未命中，不影响主流程"""
+
+    def __init__(self, backend, ttl: int = ANSWER_CACHE_TTL_SECONDS):
+        self.backend = backend
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "sets": 0, "invalidations": 0, "errors": 0}
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    @staticmethod
+    def make_key(question: str, intent: Dict[str, Union[str, bool, None]], version: int) -> str:
+        intent_part = "|".join(str(intent.get(field)) for field in
+                               ("enrollment_type", "is_score_query", "is_fee_query", "department", "major"))
+        raw_key = f"{normalize_question(question)}#{intent_part}"
+        digest = hashlib.sha1(raw_key.encode("utf-8")).hexdigest()
+        return f"{_KEY_PREFIX}v{version}:{digest}"
+
+    def get(self, question: str, intent: Dict[str, Union[str, bool, None]]) -> Tuple[Optional[Dict], Optional[int]]:
+        """
+        返回 (缓存的回答, 查询时的知识库版本号)。版本号需原样传给 set：
+        生成回答期间知识库若发生变化，回答会写到已失效的旧版本下，不会被当作新版本的回答返回。
+        缓存被禁用或后端出错时版本号为 None，本次回答不写入缓存。
+        """
+        if self.backend is None:
+            return None, None
+        try:
+            version = self.backend.get_version()
+            value = self.backend.get(self.make_key(question, intent, version))
+        except Exception as e:
+            self._count("errors")
+            print(f"读取问答缓存时发生错误: {e}")
+            return None, None
+        if value is None:
+            self._count("misses")
+            return None, version
+        self._count("hits")
+        return json.loads(value), version
+
+    def set(self, question: str, intent: Dict[str, Union[str, bool, None]], answer: Dict, version: int):
+        if self.backend is None:
+            return
+        try:
+            self.backend.set(self.make_key(question, intent, version), json.dumps(answer, ensure_ascii=False),
+                             self.ttl)
+            self._count("sets")
+        except Exception as e:
+            self._count("errors")
+            print(f"写入问答缓存时发生错误: {e}")
+
+    def invalidate(self, reason: str = ""):
+        """知识库发生变化时调用：递增知识库版本号，使所有已缓存的回答失效"""
+        if self.backend is None:
+            return
+        try:
+            version = self.backend.bump_version()
+            self._count("invalidations")
+            print(f"问答缓存已失效（{reason}），当前知识库版本 {version}。")
+        except Exception as e:
+            self._count("errors")
+            print(f"使问答缓存失效时发生错误: {e}")
+
+    def get_stats(self) -> Dict[str, Optional[Union[int, str]]]:
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else None
+        stats["backend"] = type(self.backend).__name__ if self.backend is not None else None
+        if self.backend is None:
+            stats["entries"] = None
+            stats["knowledge_version"] = None
+            return stats
+        try:
+            stats["entries"] = self.backend.size()
+            stats["knowledge_version"] = self.backend.get_version()
+        except Exception:
+            stats["entries"] = None
+            stats["knowledge_version"] = None
+        return stats
+
+
+def create_cache_backend():
+    """多 worker 部署时只能使用 Redis 后端；Redis 不可用时禁用问答缓存（返回 None），避免返回过期回答"""
+    if ANSWER_CACHE_BACKEND == "redis":
+        try:
+            return RedisCacheBackend()
+        except Exception as e:
+            if WEB_CONCURRENCY > 1:
+                print(f"警告: 无法连接 Redis 缓存（{e}），多 worker 部署下问答缓存已禁用。")
+                return None
+            print(f"警告: 无法连接 Redis 缓存（{e}），改用进程内缓存。")
+    elif WEB_CONCURRENCY > 1:
+        print("警告: 进程内问答缓存无法在多个 worker 之间同步失效，问答缓存已禁用。"
+              "请设置 ANSWER_CACHE_BACKEND=redis。")
+        return None
+    return InMemoryCacheBackend()
+
+
+_answer_cache = AnswerCache(create_cache_backend())
+
+
+def get_answer_cache() -> AnswerCache:
+    return _answer_cache
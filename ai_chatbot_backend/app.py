@@ -1,13 +1,17 @@
 import os
 import uuid
+import asyncio
+import threading
 from datetime import datetime, date, timedelta
-from typing import List, Dict, Union, Optional
+from typing import List, Dict, Union, Optional, Tuple
 from pathlib import Path
 import json
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, HTTPException, Depends, status, UploadFile, File, BackgroundTasks, Query
+from fastapi import FastAPI, HTTPException, Depends, status, UploadFile, File, BackgroundTasks, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel, Field, ConfigDict
 import uvicorn
 
@@ -21,18 +25,33 @@ from dotenv import load_dotenv
 from sqlalchemy.orm import Session as DBSession, aliased
 from sqlalchemy import func, distinct
 from database import User, Session as DBSessionModel, Message as DBMessageModel, KnowledgeEntry, create_db_tables, \
-    get_db
+    get_db, SessionLocal
 
 # --- 导入知识抽取相关的模块 ---
-from knowledge_extractor.text_processor import get_text_from_file, clean_text, segment_sentences, load_spacy_model
-from knowledge_extractor.ner_re_pipeline import init_ner_re_components, extract_entities, extract_relations
-from knowledge_extractor.neo4j_handler import get_neo4j_driver, import_extracted_data_to_neo4j, close_neo4j_driver
+from knowledge_extractor.text_processor import get_text_from_file, load_spacy_model
+from knowledge_extractor.ner_re_pipeline import init_ner_re_components, extract_knowledge, get_extraction_stats
+from knowledge_extractor.neo4j_handler import get_neo4j_driver, import_extracted_data_to_neo4j, close_neo4j_driver, \
+    get_neo4j_pool_stats, ensure_graph_schema, get_graph_version
 from knowledge_extractor.config import SPACY_MODEL_NAME
+from intent_fast_path import LocalIntentMatcher, FAST_PATH_CONFIDENCE_THRESHOLD
+from chat_pipeline import ChatPipelineExecutor, CHAT_PIPELINE_MAX_WORKERS
+from knowledge_index import get_knowledge_index, index_knowledge_entry, refresh_knowledge_index, \
+    rebuild_knowledge_index_from_db, search_knowledge
+from llm_pool import LLMClientPool
+from prompt_budget import PromptBudgetManager
+from chat_history import load_windowed_history, refresh_session_summary, get_history_stats
+from answer_cache import get_answer_cache
+from knowledge_snapshot import get_knowledge_snapshot, refresh_knowledge_snapshot, update_snapshot_entry
+from graph_facts import get_fact_graph, refresh_fact_graph, answer_from_facts, get_fact_graph_stats
+from score_lines import index_score_lines, remove_score_lines, rebuild_score_index_from_db, lookup_score_lines, \
+    format_score_lines, get_score_line_stats
+from graph_gate import GraphQueryGate
+from graph_result_format import format_graph_rows, describe_graph_rows
 
 # --- 【新增】导入图谱查询服务 ---
 # 确保 graph_service_simple.py 在同一目录下，且环境已安装 langchain 等依赖
 try:
-    from graph_service_simple import query_graph
+    from graph_service_simple import query_graph, get_graph_service_stats
 except ImportError:
     print("警告: 未找到 graph_service_simple 模块或依赖缺失，图谱问答功能将不可用。")
 
@@ -40,6 +59,10 @@ except ImportError:
     def query_graph(query):
         return None
 
+
+    def get_graph_service_stats():
+        return None
+
 load_dotenv()
 
 # --- 讯飞星火大模型配置 ---
@@ -72,6 +95,10 @@ UPLOAD_FOLDER = BASE_DIR / 'uploaded_knowledge_files'
 UPLOAD_FOLDER.mkdir(parents=True, exist_ok=True)
 
 llm_instance: Union[ChatSparkLLM, None] = None
+# ChatSparkLLM 实例不能被多个线程同时调用，并发执行的阶段从客户端池中独占实例
+llm_pool: Union[LLMClientPool, None] = None
+# /chat/stream 使用的流式客户端池（streaming=True 时 Spark 才会逐帧返回 token）
+llm_stream_pool: Union[LLMClientPool, None] = None
 
 KNOWN_MAJORS = [
     "数字媒体技术", "通信工程", "网络工程", "物联网工程",
@@ -85,6 +112,7 @@ KNOWN_MAJORS = [
     "国际经济与贸易", "国际商务", "会展经济与管理"
 ]
 
+# 系与专业的种子词典：事实快照 (graph_facts) 从图谱加载后以图谱数据为准，图谱中缺失的部分仍使用这里的配置
 KNOWN_DEPARTMENTS_MAJORS = {
     "信息技术系": [
         "数字媒体技术", "通信工程", "网络工程", "物联网工程",
@@ -112,9 +140,21 @@ KNOWN_DEPARTMENTS_MAJORS = {
     ]
 }
 
+# 本地词典意图快速通道（命中的问题不再调用 LLM 做意图分类）
+intent_matcher = LocalIntentMatcher(KNOWN_DEPARTMENTS_MAJORS, KNOWN_MAJORS)
+
+# /chat 回答前各阶段的并发执行器（有界线程池）
+chat_pipeline = ChatPipelineExecutor()
+prompt_budget = PromptBudgetManager()
+answer_cache = get_answer_cache()
+# 按命中率决定是否值得走 Text-to-Cypher 图谱查询
+graph_gate = GraphQueryGate(get_graph_version)
+
 
 # --- 知识处理/向量化（模拟） -> 知识抽取与图谱填充 ---
-def process_knowledge_entry(knowledge_id: int, db: DBSession):
+def process_knowledge_entry(knowledge_id: int, db: DBSession, refresh_index: bool = True):
+    """refresh_index=False 用于批量处理：由调用方在整批完成后只刷新一次检索索引"""
+    entry = None
     try:
         entry = db.query(KnowledgeEntry).filter(KnowledgeEntry.id == knowledge_id).first()
         if not entry:
@@ -143,47 +183,44 @@ def process_knowledge_entry(knowledge_id: int, db: DBSession):
 
         entry.content = document_content  # 更新数据库中的完整文本内容，以便后续处理
 
-        # --- 文本预处理 ---
-        cleaned_text = clean_text(document_content)
-        sentences = segment_sentences(cleaned_text)
-
-        all_extracted_entities = []
-        all_extracted_relations = []
-
-        # --- NER & RE 流程 ---
+        # --- NER & RE 流程（先按句末标点切块再逐块清洗，nlp.pipe 批量解析，每句只解析一次，结果已去重） ---
         load_spacy_model(SPACY_MODEL_NAME)
         init_ner_re_components()
-
-        for sent_text in sentences:
-            doc = load_spacy_model()(sent_text)
-            entities = extract_entities(sent_text)
-            relations = extract_relations(doc, entities)
-
-            all_extracted_entities.extend(entities)
-            all_extracted_relations.extend(relations)
-
-        # 对抽取结果进行最终去重和清洗
-        final_entities = list({json.dumps(e, sort_keys=True, ensure_ascii=False) for e in all_extracted_entities})
-        final_entities = [json.loads(s) for s in final_entities]
-
-        final_relations = list({json.dumps(r, sort_keys=True, ensure_ascii=False) for r in all_extracted_relations})
-        final_relations = [json.loads(s) for s in final_relations]
-
-        extracted_kg_data = {"entities": final_entities, "relations": final_relations}
+        extraction = extract_knowledge(document_content)
+        extracted_kg_data = {"entities": extraction["entities"], "relations": extraction["relations"]}
+        extraction_stats = extraction["stats"]
 
         print(
-            f"知识条目 {knowledge_id} ('{entry.title}') 抽取到 {len(final_entities)} 实体, {len(final_relations)} 关系。")
+            f"知识条目 {knowledge_id} ('{entry.title}') 抽取到 {extraction_stats['entities']} 实体, "
+            f"{extraction_stats['relations']} 关系（{extraction_stats['sentences']} 句，{extraction_stats['chars']} 字，"
+            f"耗时 {extraction_stats['seconds']} 秒，{extraction_stats['chars_per_second']} 字/秒）。")
 
         # --- 导入到 Neo4j ---
-        import_extracted_data_to_neo4j(extracted_kg_data)
+        import_stats = import_extracted_data_to_neo4j(extracted_kg_data)
+        if import_stats and import_stats["batches"] > import_stats["failed_batches"]:
+            refresh_structured_facts()
+
+        # --- 切分片段并更新检索索引 ---
+        chunk_count = index_knowledge_entry(db, entry)
+        print(f"知识条目 {knowledge_id} ('{entry.title}') 已切分为 {chunk_count} 个检索片段。")
+        score_line_count = index_score_lines(db, entry)
+        if score_line_count:
+            print(f"知识条目 {knowledge_id} ('{entry.title}') 解析出 {score_line_count} 条录取分数线记录。")
 
         entry.status = "processed"
         entry.processing_notes = "知识抽取并导入图谱成功。"
+        if import_stats and import_stats["failed_batches"]:
+            entry.processing_notes = (f"知识抽取完成，但有 {import_stats['failed_batches']} 个图谱写入批次"
+                                      f"（{import_stats['failed_rows']} 条记录）失败，详见后端日志。")
         print(f"知识条目 {knowledge_id} ('{entry.title}') 处理成功并导入Neo4j。")
 
         db.add(entry)
         db.commit()
         db.refresh(entry)
+        if refresh_index:
+            refresh_knowledge_index()
+        update_snapshot_entry(entry)
+        answer_cache.invalidate(f"知识条目 {knowledge_id} 处理完成")
 
     except Exception as e:
         print(f"处理知识条目 {knowledge_id} 时发生错误: {e}")
@@ -193,13 +230,40 @@ def process_knowledge_entry(knowledge_id: int, db: DBSession):
             db.add(entry)
             db.commit()
             db.refresh(entry)
+            update_snapshot_entry(entry)
+
+
+def process_knowledge_entries(knowledge_ids: List[int], db: DBSession):
+    """依次处理一批知识条目，全部完成后只刷新一次检索索引（每次刷新都要写出完整的向量文件）"""
+    for knowledge_id in knowledge_ids:
+        process_knowledge_entry(knowledge_id, db, refresh_index=False)
+    refresh_knowledge_index()
+    answer_cache.invalidate(f"{len(knowledge_ids)} 个知识条目处理完成")
+
+
+def refresh_structured_facts():
+    """重新加载图谱事实快照，并用最新的系/专业列表重建本地意图词典"""
+    fact_graph = refresh_fact_graph(KNOWN_DEPARTMENTS_MAJORS)
+    intent_matcher.rebuild(fact_graph.departments_majors(), fact_graph.known_majors())
+
+
+def create_spark_llm(streaming: bool = False) -> ChatSparkLLM:
+    return ChatSparkLLM(
+        spark_api_url=SPARKAI_URL,
+        spark_app_id=SPARKAI_APP_ID,
+        spark_api_key=SPARKAI_API_KEY,
+        spark_api_secret=SPARKAI_API_SECRET,
+        spark_llm_domain=SPARKAI_DOMAIN,
+        streaming=streaming,
+        request_timeout=60
+    )
 
 
 # --- 1. 定义 Lifespan (替代 on_startup 和 on_shutdown) ---
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # === 启动逻辑 (Startup) ===
-    global llm_instance
+    global llm_instance, llm_pool, llm_stream_pool
     print("Initializing LLM and creating database tables...")
 
     create_db_tables()
@@ -209,15 +273,9 @@ async def lifespan(app: FastAPI):
         print("警告：SparkAI 环境变量未完全设置，无法初始化 SparkAI 模型。请检查 .env 文件。")
         llm_instance = None
     else:
-        llm_instance = ChatSparkLLM(
-            spark_api_url=SPARKAI_URL,
-            spark_app_id=SPARKAI_APP_ID,
-            spark_api_key=SPARKAI_API_KEY,
-            spark_api_secret=SPARKAI_API_SECRET,
-            spark_llm_domain=SPARKAI_DOMAIN,
-            streaming=False,
-            request_timeout=60
-        )
+        llm_instance = create_spark_llm()
+        llm_pool = LLMClientPool(create_spark_llm, size=CHAT_PIPELINE_MAX_WORKERS)
+        llm_stream_pool = LLMClientPool(lambda: create_spark_llm(streaming=True), size=CHAT_PIPELINE_MAX_WORKERS)
         print("SparkAI LLM initialized.")
 
     if llm_instance is None:
@@ -226,8 +284,13 @@ async def lifespan(app: FastAPI):
     load_spacy_model(SPACY_MODEL_NAME)
     init_ner_re_components()
     get_neo4j_driver()
+    ensure_graph_schema()
+    refresh_structured_facts()
 
-    print("Knowledge Bases will be retrieved from database dynamically.")
+    rebuild_knowledge_index_from_db()
+    rebuild_score_index_from_db()
+    refresh_knowledge_snapshot(POLICY_TITLE_KEYWORDS)
+    print("Knowledge Bases are served from the in-memory snapshot and chunk index.")
 
     # === 分界线：应用运行中 ===
     yield
@@ -235,6 +298,7 @@ async def lifespan(app: FastAPI):
     # === 关闭逻辑 (Shutdown) ===
     close_neo4j_driver()
     print("Application shutdown: Neo4j driver closed.")
+    chat_pipeline.shutdown()
 
 
 # --- FastAPI 应用 (应用 lifespan) ---
@@ -468,179 +532,457 @@ async def new_session(request: NewSessionRequest, db: DBSession = Depends(get_db
     )
 
 
+# --- /chat 回答前的各个阶段（由 chat_pipeline 并发执行） ---
+# 检索注入的片段数量：通用知识取全库 top-k，按意图选中的政策文档在该文档内取 top-k
+GENERAL_KNOWLEDGE_TOP_K = 5
+POLICY_CHUNK_TOP_K = 6
+
+# 按意图注入的政策类文档（标题关键词 -> 注入时的说明文字）
+POLICY_TITLE_KEYWORDS = {
+    "录取分数": "以下是福建师范大学协和学院录取分数详情：",
+    "收费标准": "以下是福建师范大学协和学院收费标准汇总表的内容：",
+    "本科招生章程": "以下是福建师范大学协和学院本科招生章程的内容：",
+    "专升本招生章程": "以下是福建师范大学协和学院专升本招生章程的内容：",
+}
+
+
+def call_with_llm(func, *args):
+    """从客户端池中独占一个 Spark 实例执行 func(llm, *args)"""
+    with llm_pool.acquire() as llm:
+        return func(llm, *args)
+
+
+def generate_answer(llm: ChatSparkLLM, messages_to_send: List[ChatMessage]) -> str:
+    response_obj = llm.generate([messages_to_send])
+    return response_obj.generations[0][0].text
+
+
+def summarize_history(llm: ChatSparkLLM, previous_summary: str, new_messages: List[Tuple[str, str]]) -> str:
+    """把已有摘要和新滑出窗口的对话合并成一段新的摘要"""
+    dialogue = "\n".join(f"{'家长/学生' if role == 'user' else '招生顾问'}：{content}" for role, content in new_messages)
+    prompt = f"""请将以下招生咨询对话压缩成一段不超过300字的摘要，保留用户关心的专业、系别、招生类型、分数、学费等关键信息以及已经给出的结论，不要添加对话中没有的内容。只返回摘要本身。
+
+已有摘要：
+{previous_summary or "（无）"}
+
+新的对话：
+{dialogue}"""
+    response_obj = llm.generate([[ChatMessage(role="user", content=prompt)]])
+    return response_obj.generations[0][0].text.strip()
+
+
+def refresh_history_summary(session_id: str):
+    """回答完成后的后台任务：增量更新会话的早期对话摘要"""
+    refresh_session_summary(session_id,
+                            lambda previous, messages: call_with_llm(summarize_history, previous, messages))
+
+
+def get_owned_session(db: DBSession, session_id: str, user_id: int) -> Optional[DBSessionModel]:
+    return db.query(DBSessionModel).filter(
+        DBSessionModel.id == session_id,
+        DBSessionModel.user_id == user_id
+    ).first()
+
+
+def save_chat_message(db: DBSession, session_id: str, role: str, content: str,
+                      context_references: Optional[List[str]] = None) -> DBMessageModel:
+    msg_db = DBMessageModel(
+        session_id=session_id,
+        role=role,
+        content=content,
+        context_references=context_references
+    )
+    db.add(msg_db)
+    db.commit()
+    db.refresh(msg_db)
+    return msg_db
+
+
+def fetch_knowledge_candidates() -> Dict[str, Dict[str, Dict]]:
+    """
+    从进程内知识快照中取出 /chat 可能注入的政策类条目（不访问数据库），
+    等意图识别完成后再按意图挑选。
+    """
+    snapshot = get_knowledge_snapshot()
+    policies = {}
+    for keyword in POLICY_TITLE_KEYWORDS:
+        entry = snapshot.find_by_title_keyword('policy', keyword)
+        if entry:
+            policies[keyword] = entry
+    return {"policies": policies}
+
+
+def build_knowledge_chunks(candidates: Dict, intent: Dict[str, Union[str, bool, None]], user_query: str) -> List[str]:
+    """
+    按意图挑选需要注入的知识，顺序：分数线、收费、招生章程、通用知识。
+    分数线优先注入结构化索引中与问题匹配的记录；其余只注入检索索引中与问题最相关的片段，
+    尚未建立片段的条目回退为注入全文。
+    """
+    knowledge_index = get_knowledge_index()
+    knowledge_chunks_to_inject = []
+    selected_keywords = []
+    if intent["is_score_query"]:
+        score_rows = lookup_score_lines(user_query, intent["major"])
+        if score_rows:
+            knowledge_chunks_to_inject.append(f"\n\n{POLICY_TITLE_KEYWORDS['录取分数']}\n{format_score_lines(score_rows)}")
+        else:
+            selected_keywords.append("录取分数")
+    if intent["is_fee_query"]:
+        selected_keywords.append("收费标准")
+    if intent["enrollment_type"] == "本科":
+        selected_keywords.append("本科招生章程")
+    elif intent["enrollment_type"] == "专升本":
+        selected_keywords.append("专升本招生章程")
+
+    for keyword in selected_keywords:
+        policy_entry = candidates["policies"].get(keyword)
+        if not policy_entry or not policy_entry["content"]:
+            continue
+        if knowledge_index.has_entry(policy_entry["id"]):
+            hits = search_knowledge(user_query, top_k=POLICY_CHUNK_TOP_K, knowledge_ids=[policy_entry["id"]])
+            if not hits:
+                hits = knowledge_index.chunks_of(policy_entry["id"])[:POLICY_CHUNK_TOP_K]
+            # 同一文档内的片段按原文顺序拼接
+            policy_text = "\n".join(hit["content"] for hit in sorted(hits, key=lambda hit: hit["chunk_index"]))
+        else:
+            policy_text = policy_entry["content"]
+        knowledge_chunks_to_inject.append(f"\n\n{POLICY_TITLE_KEYWORDS[keyword]}\n{policy_text}")
+
+    # 通用知识：全库混合检索 top-k 片段，按条目分组（组的顺序取该条目最相关片段的排名）
+    general_hits = search_knowledge(user_query, top_k=GENERAL_KNOWLEDGE_TOP_K, types=['major', 'campus', 'faq'])
+    grouped_hits: Dict[str, List[Dict]] = {}
+    for hit in general_hits:
+        grouped_hits.setdefault(hit["title"], []).append(hit)
+    for title, hits in grouped_hits.items():
+        general_text = "\n".join(hit["content"] for hit in sorted(hits, key=lambda hit: hit["chunk_index"]))
+        knowledge_chunks_to_inject.append(f"\n\n以下是福建师范大学协和学院的通用知识（{title}）：\n{general_text}")
+    return knowledge_chunks_to_inject
+
+
+def run_graph_query(user_query: str, use_text_to_cypher: bool = True):
+    """
+    查询知识图谱（优先使用内存中的事实快照）；出错时降级为 None，不影响主流程。
+    返回 (结果行, 是否执行了 Text-to-Cypher 查询)，后者用于更新图谱门控的命中统计。
+    """
+    fact_rows = answer_from_facts(user_query)
+    if fact_rows:
+        print(f">>> 事实快照命中，结果: {fact_rows}")
+        return fact_rows, False
+    if not use_text_to_cypher:
+        return None, False
+
+    print(f">>> 检测到相关意图，正在查询知识图谱 (Neo4j)...")
+    try:
+        graph_result = query_graph(user_query)
+        if graph_result and len(graph_result) > 0:
+            print(f">>> 图谱查询命中，结果: {graph_result}")
+        else:
+            print(">>> 图谱查询未找到直接相关的结构化数据。")
+        return graph_result, True
+    except Exception as e:
+        print(f"!!! 图谱查询模块出错（已降级，不影响主流程）: {e}")
+        return None, True
+
+
+def build_intent_instruction(identified_department: Optional[str], identified_major: Optional[str]) -> str:
+    """根据识别出的系/专业生成附加在系统提示词末尾的回答要求"""
+    if identified_department:
+        majors_in_department = get_fact_graph().majors_of(identified_department)
+        if majors_in_department:
+            majors_list_str = "、".join(majors_in_department)
+            return f"\n\n**重要提示：用户正在询问【{identified_department}】系。请严格从上述提供的所有知识中，查找并列出该系下的所有专业：{majors_list_str}。对于每个专业，提供简要的介绍（如培养目标、主要方向等）。不要提及其他系或与【{identified_department}】系无关的内容。如果知识中没有某个专业的详细信息，请注明。**"
+        else:
+            return f"\n\n**重要提示：用户正在询问【{identified_department}】系。虽然识别到该系，但其下属专业列表为空或未找到。请根据现有知识回答，或告知用户无法提供该系下属专业信息。**"
+    elif identified_major:
+        return f"\n\n**重要提示：用户正在询问【{identified_major}】专业。请严格从上述提供的所有知识中，只提取并回答关于【{identified_major}】专业的信息。不要提及其他专业或与【{identified_major}】无关的内容。如果上述知识中没有【{identified_major}】的详细信息，请礼貌地告知用户无法提供。**"
+    else:
+        return "\n\n请严格基于上述提供的知识库内容回答用户问题，不要编造或猜测。如果知识库中没有相关信息，请礼貌地告知用户无法提供。"
+
+
+def build_system_prompt(knowledge_chunks: List[str], graph_context: str, instruction: str,
+                        history_summary: str = "") -> str:
+    dynamic_system_prompt_content = SYSTEM_PROMPT
+    for chunk in knowledge_chunks:
+        dynamic_system_prompt_content += chunk
+
+    # 【新增】将图谱数据注入 Prompt
+    if graph_context:
+        dynamic_system_prompt_content += graph_context
+
+    # 窗口之外的早期对话以摘要形式提供
+    if history_summary:
+        dynamic_system_prompt_content += f"\n\n【此前对话摘要】\n{history_summary}"
+
+    dynamic_system_prompt_content += instruction
+    return dynamic_system_prompt_content
+
+
+def load_session_history(db: DBSession, session_id: str) -> Tuple[str, List[ChatMessage]]:
+    """返回早期对话摘要和最近几轮的原文消息"""
+    history_summary, recent_messages = load_windowed_history(db, session_id)
+    return history_summary, [ChatMessage(role=role, content=content) for role, content in recent_messages]
+
+
+async def prepare_chat_context(request: ChatRequest, db: DBSession) -> Dict:
+    """
+    并发执行意图识别、知识图谱查询和知识库检索，然后按原有顺序拼接 Prompt。
+    返回待发送给 LLM 的消息列表、引用的知识和识别出的意图。
+    """
+    # 关键词信号足以让门控放行时，图谱查询不必等待意图识别结果，提前并发发起
+    graph_decision = graph_gate.decide(request.message, final=False)
+    graph_started = graph_decision.query
+    stages = {
+        "intent": chat_pipeline.run(call_with_llm, resolve_query_intent, request.message),
+        "history": chat_pipeline.run(load_session_history, db, request.session_id),
+    }
+    if graph_started:
+        stages["graph"] = chat_pipeline.run(run_graph_query, request.message)
+    results = await chat_pipeline.gather(stages)
+
+    # 1. 识别意图 (优先本地词典快速通道，置信度不足时单次LLM调用完成全部分类)
+    intent = results["intent"]
+    identified_department = intent["department"]
+    identified_major = intent["major"]
+    print(
+        f"(内部判断：用户问题招生类型为：{intent['enrollment_type']}, 分数线：{intent['is_score_query']}, 收费：{intent['is_fee_query']}, 系：{identified_department}, 专业：{identified_major})")
+
+    # 只缓存会话中的第一个问题：之后的回答依赖上下文，不能跨会话复用。
+    # 新会话中已有一条助手欢迎语，因此按用户消息计数（当前问题是唯一一条用户消息）
+    history_summary, current_history = results["history"]
+    user_message_count = sum(1 for message in current_history if message.role == "user")
+    cacheable = user_message_count == 1 and not history_summary
+    cache_version = None
+    if cacheable:
+        cached_answer, cache_version = await chat_pipeline.run(answer_cache.get, request.message, intent)
+        if cached_answer:
+            print(">>> 问答缓存命中，跳过 LLM 生成。")
+            return {"messages": None, "context_refs": cached_answer["context_refs"], "intent": intent,
+                    "cacheable": False, "cache_version": None, "cached_response": cached_answer["response"]}
+        cacheable = cache_version is not None
+
+    # 提前查询未放行时，结合意图识别结果重新判断；门控跳过时仍查询事实快照，只省去 Text-to-Cypher
+    graph_result, graph_queried = results.get("graph", (None, False))
+    if not graph_started:
+        graph_decision = graph_gate.decide(request.message, intent)
+        if graph_decision.signals:
+            graph_result, graph_queried = await chat_pipeline.run(run_graph_query, request.message,
+                                                                  graph_decision.query)
+    if graph_queried:
+        graph_gate.record(graph_gate.signals(request.message, intent), bool(graph_result))
+    elif graph_decision.reason == "cold" and not graph_result:
+        print(f">>> 图谱门控：信号 {graph_decision.signals} 历史命中率过低，跳过 Text-to-Cypher 查询。")
+
+    graph_context = ""
+    graph_table = format_graph_rows(graph_result) if graph_result else ""
+    if graph_table:
+        # 将结构化数据渲染为紧凑表格（去重、限制行数）
+        graph_context = f"\n\n【数据库精确记录（优先级最高）】\n系统已从知识图谱数据库中查询到以下精确数据，请直接根据此数据回答，尤其是数字和金额：\n{graph_table}"
+
+    # 2. 检索 SQL 知识库 (原有的 RAG 流程)
+    knowledge_chunks_to_inject = build_knowledge_chunks(fetch_knowledge_candidates(), intent, request.message)
+
+    # 3. 在 token 预算内拼接 Prompt（去重后按优先级裁剪图谱数据、知识片段和历史消息）
+    instruction = build_intent_instruction(identified_department, identified_major)
+    budgeted = prompt_budget.allocate(SYSTEM_PROMPT, instruction, graph_context,
+                                      knowledge_chunks_to_inject, current_history, history_summary)
+    graph_context = budgeted["graph_context"]
+    knowledge_chunks_to_inject = budgeted["knowledge_chunks"]
+    print(f"(Prompt 预估 {budgeted['prompt_tokens']} tokens，预算 {prompt_budget.budget})")
+
+    dynamic_system_prompt_content = build_system_prompt(knowledge_chunks_to_inject, graph_context, instruction,
+                                                        budgeted["history_summary"])
+    messages_to_send = [ChatMessage(role="system", content=dynamic_system_prompt_content)]
+    messages_to_send.extend(budgeted["history"])
+
+    # 记录本次回答引用了哪些知识（图谱 + 文档）
+    context_refs = list(knowledge_chunks_to_inject)
+    if graph_context:
+        context_refs.append(describe_graph_rows(graph_result))
+
+    return {"messages": messages_to_send, "context_refs": context_refs, "intent": intent,
+            "cacheable": cacheable, "cache_version": cache_version, "cached_response": None}
+
+
+def cache_answer(request: ChatRequest, chat_context: Dict, answer: str):
+    """以查询缓存时读到的知识库版本号写入，生成期间知识库发生变化时该回答随旧版本一起失效"""
+    if chat_context["cacheable"] and answer:
+        answer_cache.set(request.message, chat_context["intent"],
+                         {"response": answer, "context_refs": chat_context["context_refs"]},
+                         chat_context["cache_version"])
+
+
 @app.post("/chat", response_model=ChatResponse)
-async def chat_endpoint(request: ChatRequest, db: DBSession = Depends(get_db)):
+async def chat_endpoint(request: ChatRequest, background_tasks: BackgroundTasks, db: DBSession = Depends(get_db)):
     if llm_instance is None:
         raise HTTPException(status_code=503, detail="AI model not initialized. Please check backend logs.")
 
-    db_session = db.query(DBSessionModel).filter(
-        DBSessionModel.id == request.session_id,
-        DBSessionModel.user_id == request.user_id
-    ).first()
+    db_session = await chat_pipeline.run(get_owned_session, db, request.session_id, request.user_id)
 
     if not db_session:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
                             detail="Session not found or does not belong to this user.")
 
     try:
-        user_msg_db = DBMessageModel(session_id=request.session_id, role="user", content=request.message)
-        db.add(user_msg_db)
-        db.commit()
-        db.refresh(user_msg_db)
+        await chat_pipeline.run(save_chat_message, db, request.session_id, "user", request.message)
 
-        # 1. 识别意图 (基础分类)
-        enrollment_type = classify_query_type(llm_instance, request.message)
-        is_score_query = is_score_line_query(llm_instance, request.message)
-        is_fee_query_result = is_fee_query(llm_instance, request.message)
-        identified_department = identify_department_query(llm_instance, request.message)
-        identified_major = None
+        chat_context = await prepare_chat_context(request, db)
 
-        if not identified_department:
-            identified_major = identify_major_query(llm_instance, request.message)
+        if chat_context["cached_response"] is not None:
+            ai_response_content = chat_context["cached_response"]
+        else:
+            ai_response_content = await chat_pipeline.run(call_with_llm, generate_answer, chat_context["messages"])
+            await chat_pipeline.run(cache_answer, request, chat_context, ai_response_content)
 
-        print(
-            f"(内部判断：用户问题招生类型为：{enrollment_type}, 分数线：{is_score_query}, 收费：{is_fee_query_result}, 系：{identified_department}, 专业：{identified_major})")
+        ai_msg_db = await chat_pipeline.run(save_chat_message, db, request.session_id, "assistant",
+                                            ai_response_content, chat_context["context_refs"])
+        background_tasks.add_task(refresh_history_summary, request.session_id)
+
+        return ChatResponse(response=ai_response_content, message_id=ai_msg_db.id)
+
+    except Exception as e:
+        print(f"Error in chat endpoint for session {request.session_id} (user {request.user_id}): {e}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {e}")
 
-        dynamic_system_prompt_content = SYSTEM_PROMPT
-        knowledge_chunks_to_inject = []
 
-        # =================== 【新增】图谱增强查询逻辑开始 ===================
-        # 这里我们集成 graph_service_simple 的查询
-        graph_context = ""
+# --- 流式问答 (SSE) ---
+class StreamCancelled(Exception):
+    """客户端断开连接，流式生成被取消"""
 
-        # 定义触发词，减少不必要的查询开销
-        # 当问题涉及费用、分数、专业归属等结构化数据强相关的领域时，优先查图谱
-        triggers = ["学费", "费用", "多少钱", "系", "学院", "分数", "属于", "专业", "课程"]
 
-        # 简单的触发条件：关键词匹配 或 意图分类器认为是相关问题
-        should_query_graph = any(trigger in request.message for trigger in
-                                 triggers) or is_fee_query_result or is_score_query or identified_major or identified_department
+def format_sse(event: str, payload: Dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+def _bind_stream_cancel_hook(llm: ChatSparkLLM, cancel_event: threading.Event):
+    """
+    在 Spark 客户端的 on_message 回调上挂一个钩子：取消后收到下一帧时直接关闭 websocket，
+    让上游请求尽早结束，而不是在后台把整段回答生成完。
+    """
+    spark_client = getattr(llm, "client", None)
+    original_on_message = getattr(spark_client, "on_message", None)
+    if original_on_message is None:
+        return None
 
-        if should_query_graph:
-            print(f">>> 检测到相关意图，正在查询知识图谱 (Neo4j)...")
+    def on_message_with_cancel(ws, message):
+        if cancel_event.is_set():
+            ws.close()
+            return
+        original_on_message(ws, message)
+
+    spark_client.on_message = on_message_with_cancel
+    return spark_client
+
+
+def produce_stream_tokens(messages_to_send: List[ChatMessage], emit, cancel_event: threading.Event):
+    """在线程池中逐帧读取 Spark 的流式输出，通过 emit 回传给事件循环"""
+    try:
+        with llm_stream_pool.acquire() as llm:
+            spark_client = _bind_stream_cancel_hook(llm, cancel_event)
             try:
-                # 调用 graph_service_simple.py 中的查询函数
-                # 注意：这是一个同步调用，可能会增加一点响应时间
-                graph_result = query_graph(request.message)
-
-                # 如果查到了非空结果
-                if graph_result and len(graph_result) > 0:
-                    print(f">>> 图谱查询命中，结果: {graph_result}")
-                    # 将结构化数据格式化为自然语言提示
-                    graph_context = f"\n\n【数据库精确记录（优先级最高）】\n系统已从知识图谱数据库中查询到以下精确数据，请直接根据此数据回答，尤其是数字和金额：\n{str(graph_result)}"
-                else:
-                    print(">>> 图谱查询未找到直接相关的结构化数据。")
-            except Exception as e:
-                print(f"!!! 图谱查询模块出错（已降级，不影响主流程）: {e}")
-        # =================== 【新增】图谱增强查询逻辑结束 ===================
-
-        # 2. 检索 SQL 知识库 (原有的 RAG 流程)
-        if is_score_query:
-            score_kb_entry = db.query(KnowledgeEntry).filter(
-                KnowledgeEntry.type == 'policy',
-                KnowledgeEntry.title.like('%录取分数%'),
-                KnowledgeEntry.status == 'processed',
-                KnowledgeEntry.is_deleted == False
-            ).first()
-            if score_kb_entry and score_kb_entry.content:
-                chunk = f"\n\n以下是福建师范大学协和学院录取分数详情：\n{score_kb_entry.content}"
-                knowledge_chunks_to_inject.append(chunk)
-
-        if is_fee_query_result:
-            fee_kb_entry = db.query(KnowledgeEntry).filter(
-                KnowledgeEntry.type == 'policy',
-                KnowledgeEntry.title.like('%收费标准%'),
-                KnowledgeEntry.status == 'processed',
-                KnowledgeEntry.is_deleted == False
-            ).first()
-            if fee_kb_entry and fee_kb_entry.content:
-                chunk = f"\n\n以下是福建师范大学协和学院收费标准汇总表的内容：\n{fee_kb_entry.content}"
-                knowledge_chunks_to_inject.append(chunk)
-
-        if enrollment_type == "本科":
-            undergrad_kb_entry = db.query(KnowledgeEntry).filter(
-                KnowledgeEntry.type == 'policy',
-                KnowledgeEntry.title.like('%本科招生章程%'),
-                KnowledgeEntry.status == 'processed',
-                KnowledgeEntry.is_deleted == False
-            ).first()
-            if undergrad_kb_entry and undergrad_kb_entry.content:
-                chunk = f"\n\n以下是福建师范大学协和学院本科招生章程的内容：\n{undergrad_kb_entry.content}"
-                knowledge_chunks_to_inject.append(chunk)
-        elif enrollment_type == "专升本":
-            junior_kb_entry = db.query(KnowledgeEntry).filter(
-                KnowledgeEntry.type == 'policy',
-                KnowledgeEntry.title.like('%专升本招生章程%'),
-                KnowledgeEntry.status == 'processed',
-                KnowledgeEntry.is_deleted == False
-            ).first()
-            if junior_kb_entry and junior_kb_entry.content:
-                chunk = f"\n\n以下是福建师范大学协和学院专升本招生章程的内容：\n{junior_kb_entry.content}"
-                knowledge_chunks_to_inject.append(chunk)
-
-        general_knowledge_entries = db.query(KnowledgeEntry).filter(
-            KnowledgeEntry.type.in_(['major', 'campus', 'faq']),
-            KnowledgeEntry.status == 'processed',
-            KnowledgeEntry.is_deleted == False
-        ).all()
-        for entry in general_knowledge_entries:
-            if entry.content:
-                chunk = f"\n\n以下是福建师范大学协和学院的通用知识（{entry.title}）：\n{entry.content}"
-                knowledge_chunks_to_inject.append(chunk)
-
-        # 3. 拼接 Prompt
-        for chunk in knowledge_chunks_to_inject:
-            dynamic_system_prompt_content += chunk
-
-        # 【新增】将图谱数据注入 Prompt
-        if graph_context:
-            dynamic_system_prompt_content += graph_context
-
-        if identified_department:
-            majors_in_department = KNOWN_DEPARTMENTS_MAJORS.get(identified_department, [])
-            if majors_in_department:
-                majors_list_str = "、".join(majors_in_department)
-                dynamic_system_prompt_content += f"\n\n**重要提示：用户正在询问【{identified_department}】系。请严格从上述提供的所有知识中，查找并列出该系下的所有专业：{majors_list_str}。对于每个专业，提供简要的介绍（如培养目标、主要方向等）。不要提及其他系或与【{identified_department}】系无关的内容。如果知识中没有某个专业的详细信息，请注明。**"
+                for chunk in llm.stream(messages_to_send):
+                    if cancel_event.is_set():
+                        # 抛出异常让客户端池丢弃该实例（其内部队列可能还残留未读的帧）
+                        raise StreamCancelled()
+                    if chunk.content:
+                        emit(("delta", str(chunk.content)))
+            finally:
+                # 取消时保留钩子，让后台的 websocket 在下一帧到达时关闭；该实例随后会被客户端池丢弃
+                if spark_client is not None and not cancel_event.is_set():
+                    del spark_client.on_message
+        emit(("end", None))
+    except StreamCancelled:
+        print("流式回答已取消：客户端断开连接。")
+    except Exception as e:
+        print(f"流式生成回答时发生错误: {e}")
+        emit(("error", str(e)))
+
+
+def persist_assistant_message(session_id: str, content: str, context_references: List[str]) -> int:
+    """流式回答结束后保存 AI 消息（使用独立的数据库会话，请求级会话此时可能已关闭）"""
+    db = SessionLocal()
+    try:
+        return save_chat_message(db, session_id, "assistant", content, context_references).id
+    finally:
+        db.close()
+
+
+async def stream_chat_answer(http_request: Request, request: ChatRequest, chat_context: Dict):
+    session_id = request.session_id
+    if chat_context["cached_response"] is not None:
+        # 缓存命中：整段回答作为一个 delta 事件发送
+        message_id = await chat_pipeline.run(persist_assistant_message, session_id, chat_context["cached_response"],
+                                             chat_context["context_refs"])
+        yield format_sse("delta", {"content": chat_context["cached_response"]})
+        yield format_sse("done", {"message_id": message_id})
+        return
+
+    loop = asyncio.get_running_loop()
+    token_queue: asyncio.Queue = asyncio.Queue()
+    cancel_event = threading.Event()
+
+    def emit(item):
+        loop.call_soon_threadsafe(token_queue.put_nowait, item)
+
+    producer = asyncio.ensure_future(
+        chat_pipeline.run(produce_stream_tokens, chat_context["messages"], emit, cancel_event))
+    answer_parts: List[str] = []
+    completed = False
+    try:
+        while True:
+            if await http_request.is_disconnected():
+                print(f"会话 {session_id} 的客户端已断开，取消流式回答。")
+                return
+            try:
+                kind, payload = await asyncio.wait_for(token_queue.get(), timeout=1.0)
+            except asyncio.TimeoutError:
+                continue
+            if kind == "delta":
+                answer_parts.append(payload)
+                yield format_sse("delta", {"content": payload})
+            elif kind == "error":
+                yield format_sse("error", {"detail": f"Internal server error: {payload}"})
+                return
             else:
-                dynamic_system_prompt_content += f"\n\n**重要提示：用户正在询问【{identified_department}】系。虽然识别到该系，但其下属专业列表为空或未找到。请根据现有知识回答，或告知用户无法提供该系下属专业信息。**"
-        elif identified_major:
-            dynamic_system_prompt_content += f"\n\n**重要提示：用户正在询问【{identified_major}】专业。请严格从上述提供的所有知识中，只提取并回答关于【{identified_major}】专业的信息。不要提及其他专业或与【{identified_major}】无关的内容。如果上述知识中没有【{identified_major}】的详细信息，请礼貌地告知用户无法提供。**"
-        else:
-            dynamic_system_prompt_content += "\n\n请严格基于上述提供的知识库内容回答用户问题，不要编造或猜测。如果知识库中没有相关信息，请礼貌地告知用户无法提供。"
-
-        db_messages = db.query(DBMessageModel).filter(DBMessageModel.session_id == request.session_id).order_by(
-            DBMessageModel.timestamp).all()
-        current_history: List[ChatMessage] = []
-        for msg in db_messages:
-            current_history.append(ChatMessage(role=msg.role, content=msg.content))
-
-        messages_to_send = [ChatMessage(role="system", content=dynamic_system_prompt_content)]
-        messages_to_send.extend(current_history)
-
-        response_obj = llm_instance.generate([messages_to_send])
-        ai_response_content = response_obj.generations[0][0].text
-
-        # 记录本次回答引用了哪些知识（图谱 + 文档）
-        context_refs = knowledge_chunks_to_inject
-        if graph_context:
-            context_refs.append(f"KnowledgeGraph: {str(graph_context)[:100]}...")  # 简单记录
-
-        ai_msg_db = DBMessageModel(
-            session_id=request.session_id,
-            role="assistant",
-            content=ai_response_content,
-            context_references=context_refs
-        )
-        db.add(ai_msg_db)
-        db.commit()
-        db.refresh(ai_msg_db)
+                break
+
+        completed = True
+        answer = "".join(answer_parts)
+        message_id = await chat_pipeline.run(persist_assistant_message, session_id, answer,
+                                             chat_context["context_refs"])
+        await chat_pipeline.run(cache_answer, request, chat_context, answer)
+        yield format_sse("done", {"message_id": message_id})
+    finally:
+        if not completed:
+            cancel_event.set()
+        if producer.done() and not producer.cancelled() and producer.exception():
+            print(f"流式回答后台任务异常: {producer.exception()}")
+
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest, http_request: Request, db: DBSession = Depends(get_db)):
+    if llm_stream_pool is None:
+        raise HTTPException(status_code=503, detail="AI model not initialized. Please check backend logs.")
 
-        return ChatResponse(response=ai_response_content, message_id=ai_msg_db.id)
+    db_session = await chat_pipeline.run(get_owned_session, db, request.session_id, request.user_id)
+
+    if not db_session:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
+                            detail="Session not found or does not belong to this user.")
 
+    try:
+        await chat_pipeline.run(save_chat_message, db, request.session_id, "user", request.message)
+        chat_context = await prepare_chat_context(request, db)
     except Exception as e:
-        print(f"Error in chat endpoint for session {request.session_id} (user {request.user_id}): {e}")
+        print(f"Error in chat stream endpoint for session {request.session_id} (user {request.user_id}): {e}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {e}")
 
+    return StreamingResponse(
+        stream_chat_answer(http_request, request, chat_context),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(refresh_history_summary, request.session_id)
+    )
+
 
 @app.get("/history/{session_id}", response_model=List[Dict[str, Union[str, int, None]]])
 async def get_chat_history(session_id: str, user_id: int, db: DBSession = Depends(get_db)):
@@ -1026,6 +1368,7 @@ async def create_knowledge_entry(
     db.add(db_entry)
     db.commit()
     db.refresh(db_entry)
+    answer_cache.invalidate(f"新增知识条目 {db_entry.id}")
     background_tasks.add_task(process_knowledge_entry, db_entry.id, db)
     return db_entry
 
@@ -1119,6 +1462,11 @@ async def update_knowledge_entry(
     db.commit()
     db.refresh(db_entry)
 
+    # 重新处理完成前，旧片段不再参与检索（与原先只注入 processed 条目的语义一致）
+    refresh_knowledge_index()
+    remove_score_lines(db_entry.id)
+    update_snapshot_entry(db_entry)
+    answer_cache.invalidate(f"更新知识条目 {db_entry.id}")
     background_tasks.add_task(process_knowledge_entry, db_entry.id, db)
     return db_entry
 
@@ -1136,6 +1484,10 @@ async def delete_knowledge_entry(
     db_entry.is_deleted = True
     db.add(db_entry)
     db.commit()
+    refresh_knowledge_index()
+    remove_score_lines(knowledge_id)
+    update_snapshot_entry(db_entry)
+    answer_cache.invalidate(f"删除知识条目 {knowledge_id}")
     print(f"知识条目 {knowledge_id} 软删除成功。")
     return
 
@@ -1155,12 +1507,38 @@ async def rebuild_knowledge_index(
         entry.processing_notes = "等待重新处理"
         db.add(entry)
     db.commit()
+    # 条目已标记为等待处理，刷新一次即可从索引中移除它们的片段
+    refresh_knowledge_index()
     for entry in entries_to_reprocess:
-        background_tasks.add_task(process_knowledge_entry, entry.id, db)
+        remove_score_lines(entry.id)
+    # 整批在一个后台任务中依次处理，完成后只重建一次索引
+    background_tasks.add_task(process_knowledge_entries, [entry.id for entry in entries_to_reprocess], db)
+    refresh_knowledge_snapshot()
+    answer_cache.invalidate("重建索引")
     print(f"已触发 {len(entries_to_reprocess)} 个知识条目的重建索引任务。")
     return {"message": f"已成功触发 {len(entries_to_reprocess)} 个知识条目的重建索引任务。请稍后刷新列表查看状态。"}
 
 
+# --- 运行指标 API 端点 ---
+@app.get("/system/metrics")
+async def get_system_metrics(admin_role: str = Depends(require_admin_role)):
+    return {
+        "intent_fast_path": intent_matcher.get_stats(),
+        "chat_pipeline": chat_pipeline.get_stats(),
+        "llm_pool": llm_pool.get_stats() if llm_pool else None,
+        "llm_stream_pool": llm_stream_pool.get_stats() if llm_stream_pool else None,
+        "prompt_budget": prompt_budget.get_stats(),
+        "chat_history": get_history_stats(),
+        "answer_cache": answer_cache.get_stats(),
+        "neo4j": get_neo4j_pool_stats(),
+        "graph_service": get_graph_service_stats(),
+        "graph_facts": get_fact_graph_stats(),
+        "graph_gate": graph_gate.get_stats(),
+        "extraction": get_extraction_stats(),
+        "score_lines": get_score_line_stats(),
+    }
+
+
 # --- LLM意图分类函数 ---
 def classify_query_type(llm: ChatSparkLLM, user_query: str) -> str:
     classification_prompt = ChatMessage(
@@ -1212,10 +1590,11 @@ def is_fee_query(llm: ChatSparkLLM, user_query: str) -> bool:
 
 
 def identify_major_query(llm: ChatSparkLLM, user_query: str) -> Optional[str]:
-    if not KNOWN_MAJORS:
+    known_majors = get_fact_graph().known_majors() or KNOWN_MAJORS
+    if not known_majors:
         print("警告：KNOWN_MAJORS 列表为空，无法进行专业识别。请在 app.py 中配置 KNOWN_MAJORS。")
         return None
-    major_list_str = "、".join(KNOWN_MAJORS)
+    major_list_str = "、".join(known_majors)
     major_identification_prompt_content = f"""请判断以下用户问题是否涉及福建师范大学协和学院的某个具体专业。
 如果涉及，请从以下列表中选择**唯一最匹配的专业名称**并严格按照格式回答：`专业：[专业名称]`。**请只输出一个专业名称，不要输出多个。**
 如果问题不涉及具体专业，或无法判断，请回答`专业：无`。
@@ -1238,7 +1617,7 @@ def identify_major_query(llm: ChatSparkLLM, user_query: str) -> Optional[str]:
             temp_text = raw_identified_text.replace('，', ',').replace('、', ',')
             possible_majors_candidates = [m.strip() for m in temp_text.split(',') if m.strip()]
             for major_candidate in possible_majors_candidates:
-                if major_candidate in KNOWN_MAJORS:
+                if major_candidate in known_majors:
                     return major_candidate
             print(f"警告：LLM识别出专业 '{raw_identified_text}'，但其中没有单个名称在 KNOWN_MAJORS 列表中。")
             return None
@@ -1250,7 +1629,7 @@ def identify_major_query(llm: ChatSparkLLM, user_query: str) -> Optional[str]:
 
 
 def identify_department_query(llm: ChatSparkLLM, user_query: str) -> Optional[str]:
-    all_departments = list(KNOWN_DEPARTMENTS_MAJORS.keys())
+    all_departments = list(get_fact_graph().departments_majors()) or list(KNOWN_DEPARTMENTS_MAJORS.keys())
     if not all_departments:
         print("警告：KNOWN_DEPARTMENTS_MAJORS 列表为空，无法进行系识别。")
         return None
@@ -1289,6 +1668,136 @@ def identify_department_query(llm: ChatSparkLLM, user_query: str) -> Optional[st
         return None
 
 
+# --- 合并意图分析 (一次LLM调用返回全部意图字段) ---
+INTENT_FIELD_LABELS = {
+    "enrollment_type": "类型",
+    "is_score_query": "是否分数线",
+    "is_fee_query": "是否收费",
+    "department": "系",
+    "major": "专业",
+}
+
+
+def parse_intent_analysis(analysis_text: str) -> Dict[str, Union[str, bool, None]]:
+    """
+    严格解析合并意图分析的输出。
+    每个字段必须恰好出现一次且取值合法，否则该字段不会出现在返回结果中（由调用方回退到单项分类函数）。
+    """
+    label_to_field = {label: field for field, label in INTENT_FIELD_LABELS.items()}
+    raw_values: Dict[str, List[str]] = {}
+    for line in analysis_text.splitlines():
+        line = line.strip().strip('`').strip()
+        if not line:
+            continue
+        line = line.replace(':', '：')
+        if '：' not in line:
+            continue
+        label, value = line.split('：', 1)
+        label = label.strip().lstrip('-*').strip()
+        if label not in label_to_field:
+            continue
+        value = value.strip().strip('`').strip('[]【】').strip()
+        raw_values.setdefault(label_to_field[label], []).append(value)
+
+    fact_graph = get_fact_graph()
+    all_departments = list(fact_graph.departments_majors()) or list(KNOWN_DEPARTMENTS_MAJORS.keys())
+    known_majors = fact_graph.known_majors() or KNOWN_MAJORS
+    parsed: Dict[str, Union[str, bool, None]] = {}
+    for field, values in raw_values.items():
+        if len(values) != 1:
+            continue
+        value = values[0]
+        if field == "enrollment_type":
+            if value in ("本科", "专升本", "通用"):
+                parsed[field] = value
+        elif field in ("is_score_query", "is_fee_query"):
+            if value in ("是", "否"):
+                parsed[field] = value == "是"
+        elif field == "department":
+            if value == "无":
+                parsed[field] = None
+            elif value in all_departments:
+                parsed[field] = value
+        elif field == "major":
+            if value == "无":
+                parsed[field] = None
+            elif value in known_majors:
+                parsed[field] = value
+    return parsed
+
+
+def analyze_query_intent(llm: ChatSparkLLM, user_query: str) -> Dict[str, Union[str, bool, None]]:
+    """
+    一次LLM调用同时完成招生类型、分数线、收费、系、专业五项意图识别。
+    对于未能严格解析的字段，回退到原有的单项分类函数。
+    """
+    fact_graph = get_fact_graph()
+    department_list_str = "、".join(fact_graph.departments_majors() or KNOWN_DEPARTMENTS_MAJORS)
+    major_list_str = "、".join(fact_graph.known_majors() or KNOWN_MAJORS)
+    intent_analysis_prompt_content = f"""请分析以下用户问题，判断它在福建师范大学协和学院招生咨询中的意图，并严格按照下面五行格式回答，不要输出任何其他内容：
+类型：[本科/专升本/通用]
+是否分数线：[是/否]
+是否收费：[是/否]
+系：[系名称/无]
+专业：[专业名称/无]
+
+判断规则：
+1. 类型：问题主要涉及本科招生信息回答`本科`，涉及专升本招生信息回答`专升本`，不明确或不属于这两类回答`通用`。
+2. 是否分数线：问题与录取分数线、录取分数、分数、最低分数、往年分数、投档线、录取分数详情等相关时回答`是`。
+3. 是否收费：问题与收费标准、学费、住宿费、费用、缴费、收费、学年收费等相关时回答`是`。
+4. 系：问题涉及某个具体的系时，从已知系列表中选择**唯一最匹配的系名称**，否则回答`无`。
+5. 专业：问题涉及某个具体专业时，从已知专业列表中选择**唯一最匹配的专业名称**，否则回答`无`。
+
+已知系列表：{department_list_str}
+已知专业列表：{major_list_str}
+
+用户问题：{user_query}
+"""
+    intent_analysis_prompt = ChatMessage(role="system", content=intent_analysis_prompt_content)
+
+    parsed: Dict[str, Union[str, bool, None]] = {}
+    try:
+        response = llm.generate([[intent_analysis_prompt, ChatMessage(role="user", content=user_query)]])
+        analysis_text = response.generations[0][0].text
+        print(f"(内部判断：合并意图分析结果原始文本：{analysis_text})")
+        parsed = parse_intent_analysis(analysis_text)
+    except Exception as e:
+        print(f"合并意图分析时发生错误，将回退到单项分类: {e}")
+
+    missing_fields = [field for field in INTENT_FIELD_LABELS if field not in parsed]
+    if missing_fields:
+        print(f"(内部判断：合并意图分析缺少字段 {missing_fields}，回退到单项分类函数)")
+
+    if "enrollment_type" not in parsed:
+        parsed["enrollment_type"] = classify_query_type(llm, user_query)
+    if "is_score_query" not in parsed:
+        parsed["is_score_query"] = is_score_line_query(llm, user_query)
+    if "is_fee_query" not in parsed:
+        parsed["is_fee_query"] = is_fee_query(llm, user_query)
+    if "department" not in parsed:
+        parsed["department"] = identify_department_query(llm, user_query)
+
+    # 与原流程保持一致：识别到系时不再识别专业
+    if parsed["department"]:
+        parsed["major"] = None
+    elif "major" not in parsed:
+        parsed["major"] = identify_major_query(llm, user_query)
+
+    return parsed
+
+
+def resolve_query_intent(llm: ChatSparkLLM, user_query: str) -> Dict[str, Union[str, bool, None]]:
+    """先走本地词典快速通道，置信度不足时再调用 LLM 合并意图分析"""
+    local_intent = intent_matcher.match(user_query)
+    if local_intent["confidence"] >= FAST_PATH_CONFIDENCE_THRESHOLD:
+        intent_matcher.record_outcome(answered_locally=True)
+        print(f"(内部判断：本地快速通道命中，置信度 {local_intent['confidence']})")
+        return local_intent
+
+    intent_matcher.record_outcome(answered_locally=False)
+    return analyze_query_intent(llm, user_query)
+
+
 # 提供静态文件服务
 app.mount("/static", StaticFiles(directory=UPLOAD_FOLDER), name="static")
 
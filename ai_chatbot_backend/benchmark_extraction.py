@@ -0,0 +1,98 @@
+import time
+import tracemalloc
+from pathlib import Path
+
+from knowledge_extractor.config import SPACY_MODEL_NAME
+from knowledge_extractor.text_processor import get_text_from_file, build_spacy_pipeline
+from knowledge_extractor.ner_re_pipeline import init_ner_re_components, extract_knowledge
+
+# 👇 基准测试使用的本地语料目录
+CORPUS_DIR = "本地知识库"
+MODES = ["full", "light"]
+
+
+def load_corpus(corpus_dir: Path):
+    corpus = []
+    for file_path in sorted(corpus_dir.iterdir()):
+        if file_path.suffix not in ['.docx', '.pdf', '.txt', '.md']:
+            continue
+        # extract_knowledge 需要未清洗的原文（先按句末标点切块再清洗）
+        text = get_text_from_file(file_path)
+        if text:
+            corpus.append((file_path.name, text))
+    return corpus
+
+
+def entity_keys(entities):
+    # 实体偏移量是句内偏移，两种模式分句不同时必然不同，因此只比较文本和标签
+    return sorted({(e['text'], e['label']) for e in entities})
+
+
+def relation_keys(relations):
+    keys = set()
+    for r in relations:
+        target = r['target']['text'] if 'target' in r else r['target_id_info']['amount']
+        keys.add((r['type'], r['source']['text'], str(target)))
+    return sorted(keys)
+
+
+def benchmark_mode(mode: str, corpus):
+    # 1. 加载管线（记录耗时和 Python 侧内存峰值）
+    tracemalloc.start()
+    started_at = time.perf_counter()
+    nlp = build_spacy_pipeline(SPACY_MODEL_NAME, mode)
+    load_seconds = time.perf_counter() - started_at
+    _, load_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    init_ner_re_components(nlp)
+
+    # 2. 抽取整个语料
+    results = {}
+    started_at = time.perf_counter()
+    for name, text in corpus:
+        results[name] = extract_knowledge(text)
+    extract_seconds = time.perf_counter() - started_at
+
+    total_chars = sum(len(text) for _, text in corpus)
+    print(f"\n--- 模式 {mode}（组件: {nlp.pipe_names}）---")
+    print(f"加载耗时: {load_seconds:.2f} 秒，加载内存峰值: {load_peak / 1024 / 1024:.1f} MB")
+    print(f"抽取耗时: {extract_seconds:.2f} 秒，吞吐: {total_chars / extract_seconds:.0f} 字/秒")
+    return results, extract_seconds
+
+
+def run_benchmark():
+    corpus_dir = Path(CORPUS_DIR)
+    if not corpus_dir.exists():
+        print(f"❌ 错误：找不到语料目录: {corpus_dir.absolute()}")
+        return
+
+    corpus = load_corpus(corpus_dir)
+    print(f"--- 语料：{len(corpus)} 个文件，共 {sum(len(text) for _, text in corpus)} 字 ---")
+
+    results = {mode: benchmark_mode(mode, corpus) for mode in MODES}
+    (full_results, full_seconds), (light_results, light_seconds) = results["full"], results["light"]
+
+    # 3. 比较两种模式的实体和关系抽取结果
+    print("\n--- 结果对比 ---")
+    mismatched = []
+    for name, _ in corpus:
+        for kind, to_keys in (("entities", entity_keys), ("relations", relation_keys)):
+            full_keys = to_keys(full_results[name][kind])
+            light_keys = to_keys(light_results[name][kind])
+            if full_keys == light_keys:
+                continue
+            if name not in mismatched:
+                mismatched.append(name)
+            print(f"⚠️ {name}: {kind} full {len(full_keys)} 条，light {len(light_keys)} 条")
+            print(f"    仅 full: {sorted(set(full_keys) - set(light_keys))[:5]}")
+            print(f"    仅 light: {sorted(set(light_keys) - set(full_keys))[:5]}")
+
+    print(f"\n👉 light 模式加速比: {full_seconds / light_seconds:.1f}x")
+    if not mismatched:
+        print("✅✅✅ 两种模式的实体和关系抽取结果完全一致，可以设置 SPACY_PIPELINE_MODE=light。 ✅✅✅")
+    else:
+        print(f"❌ {len(mismatched)} 个文件的抽取结果不一致（通常是块内分句边界不同），请检查后再切换模式。")
+
+
+if __name__ == "__main__":
+    run_benchmark()
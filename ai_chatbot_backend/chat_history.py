@@ -0,0 +1,103 @@
+# chat_history.py
+# 会话历史窗口：Prompt 中只保留最近 N 轮原文，更早的对话压缩成存放在 session_summaries 表中的滚动摘要。
+# 每轮只从 MySQL 读取窗口内的消息，摘要在回答完成后于后台增量刷新，长会话的单轮开销保持不变。
+import os
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session as DBSession
+
+from database import Message as DBMessageModel, SessionSummary, SessionLocal
+
+# 原文保留的最近对话轮数（一问一答为一轮）
+HISTORY_WINDOW_TURNS = int(os.getenv("HISTORY_WINDOW_TURNS", "4"))
+# 窗口外累计到这么多轮未摘要的对话时才调用一次 LLM 更新摘要，避免每轮都生成摘要
+SUMMARY_REFRESH_TURNS = int(os.getenv("SUMMARY_REFRESH_TURNS", "2"))
+SUMMARY_MAX_CHARS = 400
+
+# 一次读取的消息上限：窗口 + 等待下一次摘要的若干轮 + 当前问题
+MAX_HISTORY_ROWS = 2 * (HISTORY_WINDOW_TURNS + SUMMARY_REFRESH_TURNS) + 1
+
+_refreshing_sessions = set()
+_refreshing_lock = threading.Lock()
+_stats = {"summary_refreshes": 0, "summary_failures": 0, "summarized_messages": 0}
+
+
+def load_windowed_history(db: DBSession, session_id: str) -> Tuple[str, List[Tuple[str, str]]]:
+    """
+    返回 (早期对话摘要, [(role, content), ...])。
+    只读取摘要之后的最近 MAX_HISTORY_ROWS 条消息的 role/content 两列。
+    """
+    summary_row = db.query(SessionSummary).filter(SessionSummary.session_id == session_id).first()
+    summarized_until_id = summary_row.summarized_until_id if summary_row else 0
+
+    rows = db.query(DBMessageModel.role, DBMessageModel.content).filter(
+        DBMessageModel.session_id == session_id,
+        DBMessageModel.id > summarized_until_id
+    ).order_by(DBMessageModel.id.desc()).limit(MAX_HISTORY_ROWS).all()
+    rows.reverse()
+    return (summary_row.summary if summary_row else ""), [(row.role, row.content) for row in rows]
+
+
+def refresh_session_summary(session_id: str, summarize: Callable[[str, List[Tuple[str, str]]], str]):
+    """
+    回答完成后在后台调用：窗口外未摘要的消息达到 SUMMARY_REFRESH_TURNS 轮时，
+    把它们和已有摘要一起交给 summarize(旧摘要, 新消息) 生成新摘要。
+    """
+    with _refreshing_lock:
+        if session_id in _refreshing_sessions:
+            return
+        _refreshing_sessions.add(session_id)
+
+    db = SessionLocal()
+    try:
+        summary_row = db.query(SessionSummary).filter(SessionSummary.session_id == session_id).first()
+        summarized_until_id = summary_row.summarized_until_id if summary_row else 0
+
+        pending_count = db.query(DBMessageModel.id).filter(
+            DBMessageModel.session_id == session_id,
+            DBMessageModel.id > summarized_until_id
+        ).count()
+        overflow = pending_count - 2 * HISTORY_WINDOW_TURNS
+        if overflow < 2 * SUMMARY_REFRESH_TURNS:
+            return
+
+        rows = db.query(DBMessageModel.id, DBMessageModel.role, DBMessageModel.content).filter(
+            DBMessageModel.session_id == session_id,
+            DBMessageModel.id > summarized_until_id
+        ).order_by(DBMessageModel.id).limit(overflow).all()
+
+        new_summary = summarize(summary_row.summary if summary_row else "",
+                                [(row.role, row.content) for row in rows])
+        new_summary = (new_summary or "").strip()[:SUMMARY_MAX_CHARS]
+        if not new_summary:
+            return
+
+        if summary_row is None:
+            summary_row = SessionSummary(session_id=session_id)
+            db.add(summary_row)
+        summary_row.summary = new_summary
+        summary_row.summarized_until_id = rows[-1].id
+        db.commit()
+        with _refreshing_lock:
+            _stats["summary_refreshes"] += 1
+            _stats["summarized_messages"] += len(rows)
+        print(f"会话 {session_id} 的历史摘要已更新，新覆盖 {len(rows)} 条消息。")
+    except Exception as e:
+        db.rollback()
+        with _refreshing_lock:
+            _stats["summary_failures"] += 1
+        print(f"更新会话 {session_id} 的历史摘要时发生错误: {e}")
+    finally:
+        db.close()
+        with _refreshing_lock:
+            _refreshing_sessions.discard(session_id)
+
+
+def get_history_stats() -> Dict[str, Optional[int]]:
+    with _refreshing_lock:
+        stats = dict(_stats)
+        stats["refreshing"] = len(_refreshing_sessions)
+    stats["window_turns"] = HISTORY_WINDOW_TURNS
+    stats["max_history_rows"] = MAX_HISTORY_ROWS
+    return stats
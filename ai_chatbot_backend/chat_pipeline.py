@@ -0,0 +1,57 @@
+# chat_pipeline.py
+# /chat 回答前各阶段的并发执行器：把阻塞的 Spark / Neo4j / MySQL 调用放到有界线程池中并发执行，
+# 避免一个慢请求卡住整个 uvicorn worker 的事件循环。
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict
+
+CHAT_PIPELINE_MAX_WORKERS = int(os.getenv("CHAT_PIPELINE_MAX_WORKERS", "16"))
+
+
+class ChatPipelineExecutor:
+    """有界线程池执行器，负责把同步阶段包装成可 await 的协程并发执行"""
+
+    def __init__(self, max_workers: int = CHAT_PIPELINE_MAX_WORKERS):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="chat-pipeline")
+        self._lock = threading.Lock()
+        self._stats = {"submitted": 0, "active": 0, "peak_active": 0, "failed": 0}
+
+    def _call(self, func: Callable[..., Any]) -> Any:
+        with self._lock:
+            self._stats["active"] += 1
+            self._stats["peak_active"] = max(self._stats["peak_active"], self._stats["active"])
+        try:
+            return func()
+        except Exception:
+            with self._lock:
+                self._stats["failed"] += 1
+            raise
+        finally:
+            with self._lock:
+                self._stats["active"] -= 1
+
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """在线程池中执行一个同步阶段，不阻塞事件循环"""
+        with self._lock:
+            self._stats["submitted"] += 1
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._call, partial(func, *args, **kwargs))
+
+    async def gather(self, stages: Dict[str, Awaitable[Any]]) -> Dict[str, Any]:
+        """并发等待多个阶段，按阶段名返回结果"""
+        names = list(stages.keys())
+        results = await asyncio.gather(*stages.values())
+        return dict(zip(names, results))
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["max_workers"] = self.max_workers
+        return stats
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
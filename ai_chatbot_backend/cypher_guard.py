@@ -0,0 +1,155 @@
+# cypher_guard.py
+# LLM 生成的 Cypher 执行前的校验：拒绝写操作、用 EXPLAIN 估算返回行数并拒绝过大的计划、
+# 缺少 LIMIT 时自动补上；执行阶段由 run_read_query 施加事务超时。
+# 一条笛卡尔积 MATCH 或无界遍历就可能拖垮 Neo4j，进而拖慢所有并发的问答。
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, NamedTuple, Optional
+
+CYPHER_MAX_ESTIMATED_ROWS = float(os.getenv("CYPHER_MAX_ESTIMATED_ROWS", "10000"))
+CYPHER_AUTO_LIMIT = int(os.getenv("CYPHER_AUTO_LIMIT", "50"))
+# 已通过 EXPLAIN 检查的语句数量上限，命中时不再重复 EXPLAIN
+CYPHER_APPROVED_CACHE_SIZE = 512
+
+# 字符串字面量、反引号标识符和注释一次扫描：先出现者优先，字符串中的“//”不会被当作注释
+_NON_CODE_PATTERN = re.compile(
+    r"(?P<string>'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\")|(?P<identifier>`[^`]*`)|"
+    r"(?P<comment>//[^\n]*|/\*.*?\*/)",
+    re.DOTALL
+)
+_WRITE_CLAUSE_PATTERN = re.compile(
+    r'\b(CREATE|MERGE|DELETE|DETACH|SET|REMOVE|DROP|FOREACH|LOAD\s+CSV|'
+    r'CALL\s+(dbms|db\.create|apoc\.(create|merge|refactor|periodic|do)))\b',
+    re.IGNORECASE
+)
+# LIMIT 必须是最后一个 RETURN 的结尾；WITH 子句中的 LIMIT 不限制最终返回的行数
+_FINAL_LIMIT_PATTERN = re.compile(r'\bLIMIT\s+(\d+|\$\w+)\s*$', re.IGNORECASE)
+_UNION_PATTERN = re.compile(r'\bUNION\b', re.IGNORECASE)
+_ORDER_BY_PATTERN = re.compile(r'\bORDER\s+BY\b', re.IGNORECASE)
+_RETURN_PATTERN = re.compile(r'\bRETURN\b', re.IGNORECASE)
+# 出现在最后一个 RETURN 之后，说明 RETURN 不是最后一个子句（或位于 CALL {} 子查询内）
+_CLAUSE_AFTER_RETURN_PATTERN = re.compile(r'\b(MATCH|WITH|CALL|UNWIND|YIELD)\b|\}', re.IGNORECASE)
+_WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+def strip_non_code(cypher: str) -> str:
+    """把字符串字面量替换为 ''、反引号标识符替换为 `_`、注释替换为空格，关键字判断只在剩下的代码上进行"""
+    def replace(match: "re.Match") -> str:
+        if match.group("string") is not None:
+            return "''"
+        if match.group("identifier") is not None:
+            return "`_`"
+        return " "
+    return _NON_CODE_PATTERN.sub(replace, cypher)
+
+
+def has_order_by(cypher: str) -> bool:
+    """语句（去掉字符串、标识符和注释后）是否带 ORDER BY"""
+    return bool(_ORDER_BY_PATTERN.search(strip_non_code(cypher)))
+
+
+def ends_with_return(code_only: str) -> bool:
+    """最后一个子句是否为 RETURN（CALL db.labels() 这类以过程调用结尾的语句不能直接追加 LIMIT）"""
+    returns = list(_RETURN_PATTERN.finditer(code_only))
+    return bool(returns) and not _CLAUSE_AFTER_RETURN_PATTERN.search(code_only, returns[-1].end())
+
+
+class GuardResult(NamedTuple):
+    allowed: bool
+    cypher: str  # 可能被补上 LIMIT 的语句
+    reason: Optional[str] = None
+
+
+def max_estimated_rows(plan: Optional[Dict[str, Any]]) -> float:
+    """执行计划树中各算子 EstimatedRows 的最大值"""
+    if not plan:
+        return 0.0
+    args = plan.get("args") or plan.get("arguments") or {}
+    estimate = float(args.get("EstimatedRows", 0) or 0)
+    for child in plan.get("children") or []:
+        estimate = max(estimate, max_estimated_rows(child))
+    return estimate
+
+
+class CypherGuard:
+    """
+    explain 为执行 EXPLAIN 并返回计划树的函数（neo4j_handler.explain_query）；
+    EXPLAIN 本身出错（如语法错误）的语句同样被拒绝。
+    """
+
+    def __init__(self, explain: Callable[[str, Optional[Dict[str, Any]]], Optional[Dict[str, Any]]],
+                 max_estimated_rows: float = CYPHER_MAX_ESTIMATED_ROWS, auto_limit: int = CYPHER_AUTO_LIMIT):
+        self._explain = explain
+        self.max_estimated_rows = max_estimated_rows
+        self.auto_limit = auto_limit
+        self._approved: "OrderedDict[str, bool]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"checked": 0, "rejected_write": 0, "rejected_multi_statement": 0,
+                       "rejected_invalid": 0, "rejected_estimated_rows": 0, "limit_added": 0}
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def add_limit(self, cypher: str) -> str:
+        """
+        最后一个子句是 RETURN 且末尾没有 LIMIT 时补上 LIMIT；含 UNION 或不以 RETURN 结尾的查询保持原样。
+        在去掉字符串、标识符和注释的语句上判断，其中的“limit”不算。
+        """
+        code_only = strip_non_code(cypher)
+        if (_FINAL_LIMIT_PATTERN.search(code_only) or _UNION_PATTERN.search(code_only)
+                or not ends_with_return(code_only)):
+            return cypher
+        self._count("limit_added")
+        # 换行后追加，避免语句以 // 注释结尾时 LIMIT 落进注释里
+        return f"{cypher.rstrip()}\nLIMIT {self.auto_limit}"
+
+    def check(self, cypher: str, params: Optional[Dict[str, Any]] = None) -> GuardResult:
+        self._count("checked")
+        cypher = cypher.strip().rstrip(";").strip()
+        # 字符串字面量、反引号标识符和注释中的关键字（如专业名称里的英文、`set` 别名）不参与判断
+        code_only = strip_non_code(cypher)
+        if ";" in code_only:
+            self._count("rejected_multi_statement")
+            return GuardResult(False, cypher, "包含多条语句")
+        write_match = _WRITE_CLAUSE_PATTERN.search(code_only)
+        if write_match:
+            self._count("rejected_write")
+            return GuardResult(False, cypher, f"包含写操作 {write_match.group(1).upper()}")
+
+        cypher = self.add_limit(cypher)
+        approved_key = _WHITESPACE_PATTERN.sub(" ", cypher)
+        with self._lock:
+            if approved_key in self._approved:
+                self._approved.move_to_end(approved_key)
+                return GuardResult(True, cypher)
+
+        try:
+            plan = self._explain(cypher, params)
+        except Exception as e:
+            self._count("rejected_invalid")
+            return GuardResult(False, cypher, f"EXPLAIN 失败: {e}")
+        if plan is None:
+            # 驱动不可用，执行阶段同样会失败，这里不做判断
+            return GuardResult(True, cypher)
+
+        estimated_rows = max_estimated_rows(plan)
+        if estimated_rows > self.max_estimated_rows:
+            self._count("rejected_estimated_rows")
+            return GuardResult(False, cypher, f"预估行数 {estimated_rows:.0f} 超过上限 {self.max_estimated_rows:.0f}")
+
+        with self._lock:
+            self._approved[approved_key] = True
+            while len(self._approved) > CYPHER_APPROVED_CACHE_SIZE:
+                self._approved.popitem(last=False)
+        return GuardResult(True, cypher)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["rejected"] = sum(value for name, value in stats.items() if name.startswith("rejected_"))
+        stats["max_estimated_rows"] = self.max_estimated_rows
+        stats["auto_limit"] = self.auto_limit
+        return stats
@@ -0,0 +1,77 @@
+# cypher_result_cache.py
+# 图谱查询结果缓存：在重新导入知识之前，同一条 Cypher + 参数返回的行不会变化。
+# 以归一化的 Cypher 文本和参数为键缓存结果，键值中记录写入时的图谱版本号，
+# import_extracted_data_to_neo4j 提交后版本号递增，旧结果随即失效。
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+GRAPH_RESULT_CACHE_SIZE = int(os.getenv("GRAPH_RESULT_CACHE_SIZE", "1024"))
+# 版本号只在导入发生的进程内递增，其他 worker 进程的缓存依靠 TTL 兜底
+GRAPH_RESULT_CACHE_TTL_SECONDS = int(os.getenv("GRAPH_RESULT_CACHE_TTL_SECONDS", "600"))
+
+_WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+def normalize_cypher(cypher: str) -> str:
+    """合并空白、去掉末尾分号，使仅排版不同的语句得到相同的键"""
+    return _WHITESPACE_PATTERN.sub(" ", cypher).strip().rstrip(";").strip()
+
+
+class CypherResultCache:
+    """有界 LRU 缓存：(Cypher, 参数) -> (图谱版本号, 过期时间, 结果行)"""
+
+    def __init__(self, version_getter: Callable[[], int], max_entries: int = GRAPH_RESULT_CACHE_SIZE,
+                 ttl: int = GRAPH_RESULT_CACHE_TTL_SECONDS):
+        self._version_getter = version_getter
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[int, float, List[Dict]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stale": 0, "evictions": 0}
+
+    @staticmethod
+    def make_key(cypher: str, params: Optional[Dict[str, Any]]) -> Tuple[str, str]:
+        return normalize_cypher(cypher), json.dumps(params or {}, sort_keys=True, ensure_ascii=False, default=str)
+
+    def get(self, cypher: str, params: Optional[Dict[str, Any]] = None) -> Optional[List[Dict]]:
+        key = self.make_key(cypher, params)
+        version = self._version_getter()
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                self._stats["misses"] += 1
+                return None
+            cached_version, expires_at, rows = item
+            if cached_version != version or expires_at < time.monotonic():
+                del self._entries[key]
+                self._stats["stale"] += 1
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+        # 返回副本，调用方修改结果不会污染缓存
+        return [dict(row) for row in rows]
+
+    def set(self, cypher: str, params: Optional[Dict[str, Any]], rows: List[Dict], version: int):
+        """version 为执行查询之前读取的图谱版本号，查询期间发生导入时该结果会被视为过期"""
+        key = self.make_key(cypher, params)
+        with self._lock:
+            self._entries[key] = (version, time.monotonic() + self.ttl, [dict(row) for row in rows])
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else None
+        stats["graph_version"] = self._version_getter()
+        return stats
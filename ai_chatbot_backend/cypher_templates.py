@@ -0,0 +1,130 @@
+# cypher_templates.py
+# Text-to-Cypher 模板缓存：问题中的专业、系、年份被识别为槽位后，问题归一化为“形状”（如“<major>学费是多少”）。
+# 某个形状第一次由 LLM 生成 Cypher 并执行成功后，把其中的槽位字面量替换成 $参数 保存为模板；
+# 之后同一形状的问题直接代入新参数执行，跳过 LLM 调用。
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from knowledge_extractor.aho_corasick import AhoCorasickAutomaton
+from knowledge_extractor.config import ENTITY_DICTIONARIES
+
+GRAPH_TEMPLATE_CACHE_SIZE = int(os.getenv("GRAPH_TEMPLATE_CACHE_SIZE", "256"))
+
+# 参与模板化的槽位：标签 -> Cypher 参数名前缀
+SLOT_PARAM_NAMES = {"MAJOR": "major", "DEPARTMENT": "department", "YEAR": "year"}
+
+_YEAR_PATTERN = re.compile(r'(?<!\d)(20\d{2})(?!\d)')
+_SHAPE_NOISE_PATTERN = re.compile(r'[\s，。！？；：、,.!?;:~～“”"\'（）()]+')
+
+
+class QueryShape(NamedTuple):
+    key: str  # 槽位替换为占位符后的归一化问题
+    params: Dict[str, Any]  # 参数名 -> 问题中的槽位值
+
+
+class CypherTemplate(NamedTuple):
+    cypher: str
+    param_names: List[str]
+
+
+class CypherTemplateCache:
+    """问题形状 -> 参数化 Cypher 模板的 LRU 缓存"""
+
+    def __init__(self, max_entries: int = GRAPH_TEMPLATE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._templates: "OrderedDict[str, CypherTemplate]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stored": 0, "rejected": 0, "evictions": 0, "discarded": 0}
+        self._automaton = AhoCorasickAutomaton()
+        for label in ("MAJOR", "DEPARTMENT"):
+            for term in ENTITY_DICTIONARIES.get(label, []):
+                self._automaton.add(term, label)
+        self._automaton.build()
+
+    def extract_shape(self, question: str) -> QueryShape:
+        """识别问题中的槽位（最长匹配优先），同类槽位按出现顺序编号为 major、major_2 ..."""
+        spans = []
+        for start, end, label in self._automaton.find_longest(question):
+            spans.append((start, end, label, question[start:end]))
+        occupied = {i for start, end, _, _ in spans for i in range(start, end)}
+        for match in _YEAR_PATTERN.finditer(question):
+            if not occupied.intersection(range(match.start(), match.end())):
+                spans.append((match.start(), match.end(), "YEAR", int(match.group(1))))
+        spans.sort(key=lambda span: span[0])
+
+        params: Dict[str, Any] = {}
+        label_counts: Dict[str, int] = {}
+        pieces = []
+        cursor = 0
+        for start, end, label, value in spans:
+            label_counts[label] = label_counts.get(label, 0) + 1
+            count = label_counts[label]
+            param_name = SLOT_PARAM_NAMES[label] if count == 1 else f"{SLOT_PARAM_NAMES[label]}_{count}"
+            params[param_name] = value
+            pieces.append(question[cursor:start])
+            pieces.append(f"<{param_name}>")
+            cursor = end
+        pieces.append(question[cursor:])
+        key = _SHAPE_NOISE_PATTERN.sub("", "".join(pieces)).lower()
+        return QueryShape(key=key, params=params)
+
+    def get(self, shape: QueryShape) -> Optional[CypherTemplate]:
+        with self._lock:
+            template = self._templates.get(shape.key)
+            if template is None or set(template.param_names) != set(shape.params):
+                self._stats["misses"] += 1
+                return None
+            self._templates.move_to_end(shape.key)
+            self._stats["hits"] += 1
+            return template
+
+    @staticmethod
+    def parameterize(cypher: str, shape: QueryShape) -> Optional[CypherTemplate]:
+        """
+        把 LLM 生成的 Cypher 中的槽位字面量替换为 $参数。
+        任何一个槽位值在 Cypher 中找不到对应字面量时返回 None（无法安全复用）。
+        """
+        template = cypher
+        # 先替换较长的值，避免短值恰好是长值一部分时被提前替换
+        for param_name, value in sorted(shape.params.items(), key=lambda item: -len(str(item[1]))):
+            if isinstance(value, int):
+                pattern = re.compile(rf'(?<![\w$]){value}(?!\w)')
+            else:
+                pattern = re.compile(rf"""(['"]){re.escape(value)}\1""")
+            template, replaced = pattern.subn(f"${param_name}", template)
+            if replaced == 0:
+                return None
+        return CypherTemplate(cypher=template, param_names=sorted(shape.params))
+
+    def store(self, shape: QueryShape, cypher: str) -> bool:
+        """Cypher 通过 CypherGuard 校验（传入 GuardResult.cypher）且执行返回数据后调用；可参数化时存为模板"""
+        template = self.parameterize(cypher, shape)
+        with self._lock:
+            if template is None:
+                self._stats["rejected"] += 1
+                return False
+            self._templates[shape.key] = template
+            self._templates.move_to_end(shape.key)
+            self._stats["stored"] += 1
+            while len(self._templates) > self.max_entries:
+                self._templates.popitem(last=False)
+                self._stats["evictions"] += 1
+        return True
+
+    def discard(self, shape: QueryShape):
+        """模板代入新参数后执行失败、没有数据或未通过校验时移除，下次重新由 LLM 生成"""
+        with self._lock:
+            if self._templates.pop(shape.key, None) is not None:
+                self._stats["discarded"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["templates"] = len(self._templates)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else None
+        stats["max_entries"] = self.max_entries
+        return stats
@@ -56,6 +56,7 @@ class Session(Base):
 
     user = relationship("User", back_populates="sessions")
     messages = relationship("Message", back_populates="session", cascade="all, delete-orphan")
+    summary = relationship("SessionSummary", uselist=False, cascade="all, delete-orphan")
 
 
 # --- Message 模型：新增的消息表 ---
@@ -105,6 +106,56 @@ class KnowledgeEntry(Base):
         return f"<KnowledgeEntry(id={self.id}, title='{self.title}', type='{self.type}', status='{self.status}', is_deleted={self.is_deleted})>"
 
 
+# --- 知识片段模型 (KnowledgeChunk)：知识条目切分后的检索单元 ---
+class KnowledgeChunk(Base):
+    __tablename__ = "knowledge_chunks"
+
+    id = Column(Integer, primary_key=True, index=True)
+    knowledge_id = Column(Integer, ForeignKey("knowledge_entries.id"), index=True, nullable=False)
+    chunk_index = Column(Integer, nullable=False)  # 片段在原文中的顺序
+    content = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.now)
+
+    def __repr__(self):
+        return f"<KnowledgeChunk(id={self.id}, knowledge_id={self.knowledge_id}, chunk_index={self.chunk_index})>"
+
+
+# --- 会话摘要模型 (SessionSummary)：滚动摘要窗口之外的早期对话 ---
+class SessionSummary(Base):
+    __tablename__ = "session_summaries"
+
+    session_id = Column(String(36), ForeignKey("sessions.id"), primary_key=True)
+    summary = Column(Text, nullable=False)
+    summarized_until_id = Column(Integer, nullable=False)  # 摘要已覆盖到的最后一条消息 id
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+    def __repr__(self):
+        return f"<SessionSummary(session_id='{self.session_id}', summarized_until_id={self.summarized_until_id})>"
+
+
+# --- 录取分数线模型 (ScoreLine)：从录取分数文档中解析出的结构化记录 ---
+class ScoreLine(Base):
+    __tablename__ = "score_lines"
+
+    id = Column(Integer, primary_key=True, index=True)
+    knowledge_id = Column(Integer, ForeignKey("knowledge_entries.id"), index=True, nullable=False)
+    year = Column(Integer, index=True, nullable=False)
+    province = Column(String(50), nullable=False)
+    admission_type = Column(String(50), nullable=False)  # 普通类 / 体育类 / 艺术类
+    subject_group = Column(String(50), index=True, nullable=True)  # 物理组 / 历史组
+    major = Column(String(100), index=True, nullable=False)  # 专业名；整体分数线记录为“普通专业”“国际课程”等类别名
+    is_overall = Column(Boolean, default=False, nullable=False)  # 是否为整体录取分数线
+    note = Column(String(100), nullable=True)  # 专业名后的括号说明，如“师范”
+    max_score = Column(Integer, nullable=True)
+    min_score = Column(Integer, nullable=True)
+    avg_score = Column(Integer, nullable=True)
+    province_rank = Column(Integer, nullable=True)  # 最低分对应的省排名
+    created_at = Column(DateTime, default=datetime.now)
+
+    def __repr__(self):
+        return f"<ScoreLine(year={self.year}, subject_group='{self.subject_group}', major='{self.major}', min_score={self.min_score})>"
+
+
 # 用于创建所有数据库表的函数
 def create_db_tables():
     print("Attempting to create database tables (sessions, messages, knowledge_entries)...")
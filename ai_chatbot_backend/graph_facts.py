@@ -0,0 +1,171 @@
+# graph_facts.py
+# 招生结构化事实的进程内只读快照：专业 -> 系、专业 -> 各年级收费标准。
+# 这部分图谱很小且很少变化，启动时和每次导入图谱后从 Neo4j 整体加载一次，
+# /chat 中常见的学费、系别问题直接在内存中回答，不再经过 LLM 生成 Cypher 和 Bolt 往返。
+import re
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from knowledge_extractor.aho_corasick import AhoCorasickAutomaton
+from knowledge_extractor.config import ENTITY_DICTIONARIES
+from knowledge_extractor.neo4j_handler import run_read_query
+
+DEPARTMENT_QUERY = """
+MATCH (d:Department)-[:OFFERS_MAJOR]-(m:Major)
+RETURN d.name AS department, m.name AS major
+"""
+FEE_QUERY = """
+MATCH (m:Major)-[r:HAS_FEE_STANDARD_FOR_YEAR]->(fs:FeeStandard)-[:HAS_FEE_ITEM]->(fi:FeeItem)
+RETURN m.name AS major, r.year AS year, fi.name AS item, fs.amount AS amount, fs.unit AS unit
+"""
+
+FEE_QUESTION_KEYWORDS = ["学费", "费用", "多少钱", "收费", "交多少"]
+# 问题中点名的收费项目（住宿费、教材费……）；未点名时只有数据中唯一的收费项目才能直接回答
+FEE_ITEM_NAMES = ENTITY_DICTIONARIES.get("FEE_ITEM", [])
+DEPARTMENT_QUESTION_KEYWORDS = ["属于", "哪个系", "什么系", "哪个学院", "哪个院系", "院系"]
+MAJORS_QUESTION_KEYWORDS = ["专业"]
+
+_YEAR_PATTERN = re.compile(r'(?<!\d)(20\d{2})(?!\d)')
+
+
+class FactGraph:
+    """
+    不可变的事实快照。系/专业关系以图谱数据为准，图谱中尚未导入的部分由种子词典补足。
+    """
+
+    def __init__(self, department_rows: List[Dict[str, Any]], fee_rows: List[Dict[str, Any]],
+                 seed_departments_majors: Optional[Dict[str, List[str]]] = None):
+        self._department_of: Dict[str, str] = {}
+        for department, majors in (seed_departments_majors or {}).items():
+            for major in majors:
+                self._department_of[major] = department
+        for row in department_rows:
+            if row.get("department") and row.get("major"):
+                self._department_of[row["major"]] = row["department"]
+
+        self._majors_of: Dict[str, List[str]] = {department: [] for department in (seed_departments_majors or {})}
+        for major, department in self._department_of.items():
+            self._majors_of.setdefault(department, []).append(major)
+
+        # 专业 -> {(年份, 收费项目) -> 收费记录}；同一专业同一年级有多个收费项目
+        self._fees: Dict[str, Dict[Tuple[int, str], Dict[str, Any]]] = {}
+        for row in fee_rows:
+            if not row.get("major") or row.get("year") is None:
+                continue
+            key = (int(row["year"]), row.get("item") or "")
+            self._fees.setdefault(row["major"], {})[key] = {
+                "major": row["major"],
+                "year": int(row["year"]),
+                "item": row.get("item"),
+                "amount": row.get("amount"),
+                "unit": row.get("unit"),
+            }
+
+        self._automaton = AhoCorasickAutomaton()
+        for department in self._majors_of:
+            self._automaton.add(department, ("DEPARTMENT", department))
+        for major in set(self._department_of) | set(self._fees):
+            self._automaton.add(major, ("MAJOR", major))
+        fee_items = {item for fees in self._fees.values() for _, item in fees if item}
+        for item in fee_items | set(FEE_ITEM_NAMES):
+            self._automaton.add(item, ("FEE_ITEM", item))
+        self._automaton.build()
+
+    def department_of(self, major: str) -> Optional[str]:
+        return self._department_of.get(major)
+
+    def majors_of(self, department: str) -> List[str]:
+        return list(self._majors_of.get(department, []))
+
+    def departments_majors(self) -> Dict[str, List[str]]:
+        return {department: list(majors) for department, majors in self._majors_of.items()}
+
+    def known_majors(self) -> List[str]:
+        return list(dict.fromkeys(list(self._department_of) + list(self._fees)))
+
+    def fees_of(self, major: str, years: Optional[Iterable[int]] = None,
+                items: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+        """专业的收费记录（按年份从新到旧），可按年份和收费项目过滤"""
+        fees = self._fees.get(major, {})
+        years = set(years) if years else None
+        items = set(items) if items else None
+        return [dict(fees[key]) for key in sorted(fees, key=lambda key: (-key[0], key[1]))
+                if (years is None or key[0] in years) and (items is None or key[1] in items)]
+
+    def lookup(self, question: str) -> Optional[List[Dict[str, Any]]]:
+        """
+        用快照回答学费、专业所属系、系下专业三类事实问题，返回与图谱查询相同形式的行列表。
+        识别不出问题类型或快照中没有对应数据时返回 None，由调用方回退到 query_graph。
+        """
+        found: Dict[str, List[str]] = {"DEPARTMENT": [], "MAJOR": [], "FEE_ITEM": []}
+        for _, _, (kind, value) in self._automaton.find_longest(question):
+            if value not in found[kind]:
+                found[kind].append(value)
+        departments, majors, fee_items = found["DEPARTMENT"], found["MAJOR"], found["FEE_ITEM"]
+        years = [int(year) for year in _YEAR_PATTERN.findall(question)]
+
+        rows: List[Dict[str, Any]] = []
+        if majors and (fee_items or any(keyword in question for keyword in FEE_QUESTION_KEYWORDS)):
+            for major in majors:
+                fees = self.fees_of(major, years, fee_items)
+                # 有专业缺少所问的收费数据，或问题没点名收费项目而数据中有多个项目时，交给图谱查询，
+                # 避免把学费当成住宿费之类的错误回答
+                if not fees or (not fee_items and len({fee["item"] for fee in fees}) > 1):
+                    return None
+                rows.extend(fees)
+        elif majors and any(keyword in question for keyword in DEPARTMENT_QUESTION_KEYWORDS):
+            for major in majors:
+                department = self.department_of(major)
+                if department is None:
+                    return None
+                rows.append({"major": major, "department": department})
+        elif departments and any(keyword in question for keyword in MAJORS_QUESTION_KEYWORDS):
+            for department in departments:
+                rows.extend({"department": department, "major": major} for major in self.majors_of(department))
+        return rows or None
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            "departments": len(self._majors_of),
+            "majors": len(self._department_of),
+            "majors_with_fees": len(self._fees),
+            "fee_records": sum(len(fees) for fees in self._fees.values()),
+        }
+
+
+_fact_graph = FactGraph([], [])
+_fact_graph_lock = threading.Lock()
+_seed_departments_majors: Dict[str, List[str]] = {}
+_lookup_stats = {"answered": 0, "fallbacks": 0}
+
+
+def refresh_fact_graph(seed_departments_majors: Optional[Dict[str, List[str]]] = None) -> FactGraph:
+    """从 Neo4j 重新加载事实快照并整体替换；Neo4j 不可用时只使用种子词典"""
+    global _fact_graph, _seed_departments_majors
+    department_rows = run_read_query(DEPARTMENT_QUERY) or []
+    fee_rows = run_read_query(FEE_QUERY) or []
+    with _fact_graph_lock:
+        if seed_departments_majors is not None:
+            _seed_departments_majors = seed_departments_majors
+        _fact_graph = FactGraph(department_rows, fee_rows, _seed_departments_majors)
+    print(f"事实快照已加载：{len(department_rows)} 条专业-系关系，{len(fee_rows)} 条收费记录。")
+    return _fact_graph
+
+
+def get_fact_graph() -> FactGraph:
+    return _fact_graph
+
+
+def answer_from_facts(question: str) -> Optional[List[Dict[str, Any]]]:
+    """用当前快照回答事实问题，并记录命中情况"""
+    rows = _fact_graph.lookup(question)
+    with _fact_graph_lock:
+        _lookup_stats["answered" if rows else "fallbacks"] += 1
+    return rows
+
+
+def get_fact_graph_stats() -> Dict[str, int]:
+    with _fact_graph_lock:
+        stats = dict(_lookup_stats)
+    stats.update(_fact_graph.get_stats())
+    return stats
@@ -0,0 +1,134 @@
+# graph_gate.py
+# 图谱查询门控：Text-to-Cypher 每次都要一次 LLM 调用加一次 Neo4j 查询。
+# 按“信号”（问题中出现的触发关键词、意图识别得到的意图）统计图谱查询的命中/未命中次数，
+# 某个问题的所有信号都已被统计证明几乎总是查不到数据时，跳过这条昂贵的路径。
+# 图谱重新导入后版本号变化，历史统计随之清空重新学习。
+import os
+import threading
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+# 可能由图谱回答的问题中常见的关键词
+GRAPH_QUERY_TRIGGERS = ["学费", "费用", "多少钱", "系", "学院", "分数", "属于", "专业", "课程"]
+# 信号至少被尝试这么多次后才参与判断，在此之前总是查询（学习阶段）
+GRAPH_GATE_MIN_SAMPLES = int(os.getenv("GRAPH_GATE_MIN_SAMPLES", "20"))
+# 命中率低于该值的信号视为“冷”信号
+GRAPH_GATE_MIN_HIT_RATE = float(os.getenv("GRAPH_GATE_MIN_HIT_RATE", "0.05"))
+# 每跳过这么多次仍放行一次（探索），使统计有机会反映图谱内容的变化；0 表示不探索
+GRAPH_GATE_EXPLORE_EVERY = int(os.getenv("GRAPH_GATE_EXPLORE_EVERY", "20"))
+
+
+class GateDecision(NamedTuple):
+    query: bool
+    reason: str  # no_signal / learning / warm / explore / cold
+    signals: List[str]
+
+
+def intent_signals(intent: Optional[Dict[str, Any]]) -> List[str]:
+    if not intent:
+        return []
+    signals = []
+    if intent.get("is_fee_query"):
+        signals.append("intent:fee")
+    if intent.get("is_score_query"):
+        signals.append("intent:score")
+    if intent.get("department"):
+        signals.append("intent:department")
+    if intent.get("major"):
+        signals.append("intent:major")
+    return signals
+
+
+class GraphQueryGate:
+    """
+    version_getter 返回当前图谱版本号（neo4j_handler.get_graph_version）。
+    只有确实执行了 Text-to-Cypher 的问题才调用 record，事实快照直接回答的问题不计入统计。
+    """
+
+    def __init__(self, version_getter: Callable[[], int], triggers: Optional[List[str]] = None,
+                 min_samples: int = GRAPH_GATE_MIN_SAMPLES, min_hit_rate: float = GRAPH_GATE_MIN_HIT_RATE,
+                 explore_every: int = GRAPH_GATE_EXPLORE_EVERY):
+        self._version_getter = version_getter
+        self.triggers = list(triggers if triggers is not None else GRAPH_QUERY_TRIGGERS)
+        self.min_samples = min_samples
+        self.min_hit_rate = min_hit_rate
+        self.explore_every = explore_every
+        self._lock = threading.Lock()
+        self._version = version_getter()
+        # 信号 -> {"attempts": 查询次数, "hits": 有数据返回的次数}
+        self._signal_stats: Dict[str, Dict[str, int]] = {}
+        self._skips_since_explore = 0
+        self._decisions = {"no_signal": 0, "learning": 0, "warm": 0, "explore": 0, "cold": 0}
+
+    def signals(self, question: str, intent: Optional[Dict[str, Any]] = None) -> List[str]:
+        """问题中出现的触发关键词 + 意图识别结果对应的信号"""
+        return [f"kw:{trigger}" for trigger in self.triggers if trigger in question] + intent_signals(intent)
+
+    def _sync_version(self):
+        # 调用方需持有 self._lock
+        version = self._version_getter()
+        if version != self._version:
+            self._version = version
+            self._signal_stats.clear()
+            self._skips_since_explore = 0
+
+    def _is_cold(self, signal: str) -> bool:
+        stats = self._signal_stats.get(signal)
+        if not stats or stats["attempts"] < self.min_samples:
+            return False
+        return stats["hits"] / stats["attempts"] < self.min_hit_rate
+
+    def decide(self, question: str, intent: Optional[Dict[str, Any]] = None, final: bool = True) -> GateDecision:
+        """
+        final=False 用于意图识别之前的提前判断：只在放行时计入决策统计，
+        不放行的问题会在拿到意图后再以 final=True 判断一次，避免重复计数。
+        """
+        signals = self.signals(question, intent)
+        with self._lock:
+            self._sync_version()
+            if not signals:
+                reason = "no_signal"
+            elif any(self._signal_stats.get(s, {}).get("attempts", 0) < self.min_samples for s in signals):
+                reason = "learning"
+            elif not all(self._is_cold(s) for s in signals):
+                reason = "warm"
+            elif not final:
+                return GateDecision(query=False, reason="cold", signals=signals)
+            else:
+                self._skips_since_explore += 1
+                if self.explore_every and self._skips_since_explore >= self.explore_every:
+                    self._skips_since_explore = 0
+                    reason = "explore"
+                else:
+                    reason = "cold"
+            if final or reason != "no_signal":
+                self._decisions[reason] += 1
+        return GateDecision(query=reason in ("learning", "warm", "explore"), reason=reason, signals=signals)
+
+    def record(self, signals: List[str], hit: bool):
+        """记录一次 Text-to-Cypher 查询的结果"""
+        with self._lock:
+            self._sync_version()
+            for signal in signals:
+                stats = self._signal_stats.setdefault(signal, {"attempts": 0, "hits": 0})
+                stats["attempts"] += 1
+                stats["hits"] += int(hit)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            decisions = dict(self._decisions)
+            signal_stats = {signal: dict(stats) for signal, stats in self._signal_stats.items()}
+            cold = sorted(signal for signal in signal_stats if self._is_cold(signal))
+            version = self._version
+        for stats in signal_stats.values():
+            stats["hit_rate"] = round(stats["hits"] / stats["attempts"], 3) if stats["attempts"] else None
+        total = sum(decisions.values())
+        skipped = decisions["no_signal"] + decisions["cold"]
+        return {
+            "decisions": decisions,
+            "skip_rate": round(skipped / total, 3) if total else None,
+            "signals": signal_stats,
+            "cold_signals": cold,
+            "graph_version": version,
+            "min_samples": self.min_samples,
+            "min_hit_rate": self.min_hit_rate,
+        }
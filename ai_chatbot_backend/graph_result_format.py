@@ -0,0 +1,103 @@
+# graph_result_format.py
+# 把图谱查询结果（字典列表）渲染为紧凑的表格文本注入 Prompt：
+# 表头只出现一次、重复行去掉、行数有上限，金额等数值统一格式，
+# 代替逐行重复所有键名的 str(graph_result)。行按查询返回的顺序渲染（保留 ORDER BY），
+# 没有 ORDER BY 的查询由 run_cypher 调用 sort_graph_rows 排成稳定的顺序。
+import json
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+GRAPH_CONTEXT_MAX_ROWS = int(os.getenv("GRAPH_CONTEXT_MAX_ROWS", "20"))
+
+# 常见返回列的中文表头，其余列保留原名
+GRAPH_COLUMN_LABELS = {
+    "major": "专业", "department": "系", "year": "年级", "item": "收费项目", "amount": "金额", "unit": "单位",
+    "course": "课程", "name": "名称", "type": "类型",
+}
+# 名称中包含这些片段的数值列按金额格式化（千分位）
+AMOUNT_COLUMN_HINTS = ("amount", "fee", "price", "tuition", "金额", "学费", "费用")
+
+
+def _is_amount_column(column: str) -> bool:
+    lowered = column.lower()
+    return any(hint in lowered for hint in AMOUNT_COLUMN_HINTS)
+
+
+def format_value(column: str, value: Any) -> str:
+    if value is None:
+        return "-"
+    if isinstance(value, bool):
+        return "是" if value else "否"
+    if isinstance(value, (int, float)):
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        if _is_amount_column(column):
+            text = f"{value:,}" if isinstance(value, int) else f"{value:,.2f}"
+        else:
+            text = str(value) if isinstance(value, int) else f"{value:.2f}"
+        return text.rstrip("0").rstrip(".") if "." in text else text
+    if isinstance(value, (list, tuple, dict)):
+        return json.dumps(value, ensure_ascii=False, default=str, separators=(",", ":"))
+    # 单元格内的换行和分隔符会破坏表格结构
+    return str(value).replace("\n", " ").replace("|", "/").strip()
+
+
+def _columns(rows: List[Dict[str, Any]]) -> List[str]:
+    """按首次出现的顺序收集列名，去掉所有行都为空的列"""
+    columns = list(dict.fromkeys(column for row in rows for column in row))
+    return [column for column in columns if any(row.get(column) is not None for row in rows)]
+
+
+def _sort_key(value: Any) -> Tuple[int, Any]:
+    # 数值按大小比较（避免按文本比较时“10,000”排在“9,000”前面），空值排在最后
+    if value is None:
+        return (2, "")
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return (0, value)
+    return (1, str(value))
+
+
+def sort_graph_rows(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """查询没有 ORDER BY 时 Neo4j 返回顺序不固定，按各列的值排成稳定顺序，返回新列表"""
+    rows = [row for row in rows if isinstance(row, dict)]
+    columns = list(dict.fromkeys(column for row in rows for column in row))
+    return sorted(rows, key=lambda row: [_sort_key(row.get(column)) for column in columns])
+
+
+def _rendered_rows(rows: List[Dict[str, Any]], columns: List[str]) -> List[List[str]]:
+    """格式化后按原顺序去重，保留查询的 ORDER BY"""
+    unique = dict.fromkeys(tuple(format_value(column, row.get(column)) for column in columns) for row in rows)
+    return [list(cells) for cells in unique]
+
+
+def format_graph_rows(rows: Optional[List[Dict[str, Any]]], max_rows: int = GRAPH_CONTEXT_MAX_ROWS) -> str:
+    """
+    渲染为“列1 | 列2”形式的表格；只有一列时渲染为顿号分隔的列表。
+    超过 max_rows 的行不渲染，并在末尾注明省略的行数。
+    """
+    rows = [row for row in rows or [] if isinstance(row, dict)]
+    columns = _columns(rows)
+    if not columns:
+        return ""
+    rendered = _rendered_rows(rows, columns)
+    omitted = max(0, len(rendered) - max_rows)
+    rendered = rendered[:max_rows]
+
+    labels = [GRAPH_COLUMN_LABELS.get(column, column) for column in columns]
+    if len(columns) == 1:
+        text = f"{labels[0]}：" + "、".join(cells[0] for cells in rendered)
+    else:
+        lines = [" | ".join(labels)]
+        lines.extend(" | ".join(cells) for cells in rendered)
+        text = "\n".join(lines)
+    if omitted:
+        text += f"\n（另有 {omitted} 行未列出）"
+    return text
+
+
+def describe_graph_rows(rows: Optional[List[Dict[str, Any]]]) -> str:
+    """context_references 中记录的简短说明，例如“KnowledgeGraph: 3 行 [专业, 年级, 金额]”，行数为去重后的行数"""
+    rows = [row for row in rows or [] if isinstance(row, dict)]
+    columns = _columns(rows)
+    labels = [GRAPH_COLUMN_LABELS.get(column, column) for column in columns]
+    return f"KnowledgeGraph: {len(_rendered_rows(rows, columns))} 行 [{', '.join(labels)}]"
@@ -1,37 +1,40 @@
 # graph_service_simple.py
 import os
 from dotenv import load_dotenv
-from neo4j import GraphDatabase
 from langchain_community.chat_models import ChatSparkLLM
 from langchain.prompts import PromptTemplate
 
+from llm_pool import LLMClientPool
+from knowledge_extractor.neo4j_handler import run_read_query, get_graph_version, explain_query
+from cypher_templates import CypherTemplateCache
+from cypher_result_cache import CypherResultCache
+from cypher_guard import CypherGuard, has_order_by
+from graph_result_format import sort_graph_rows
+
 # 加载环境变量
 load_dotenv()
 
 # ==========================================
-# 1. 数据库连接配置 (手动模式，无需插件)
+# 1. 数据库连接配置 (手动模式，无需插件；连接复用 neo4j_handler 中的共享驱动，
+#    连接参数统一由 knowledge_extractor/config.py 读取，这里不再单独校验)
 # ==========================================
-URI = os.getenv('NEO4J_URI')
-USERNAME = os.getenv('NEO4J_USERNAME')
-PASSWORD = os.getenv('NEO4J_PASSWORD')
 
-if not all([URI, USERNAME, PASSWORD]):
-    raise ValueError("请检查 .env 文件，确保 NEO4J_URI, NEO4J_USERNAME, NEO4J_PASSWORD 都已设置！")
+# 重新导入知识前，相同 Cypher + 参数的结果直接从缓存返回，不访问 Neo4j
+result_cache = CypherResultCache(get_graph_version)
 
 
-def run_cypher(query: str):
-    """原生 Neo4j 驱动执行器"""
-    driver = GraphDatabase.driver(URI, auth=(USERNAME, PASSWORD))
-    try:
-        driver.verify_connectivity()
-        records, summary, keys = driver.execute_query(query)
-        # 转换为字典列表
-        return [dict(record) for record in records]
-    except Exception as e:
-        print(f"执行 Cypher 报错: {e}")
-        return None
-    finally:
-        driver.close()
+def run_cypher(query: str, params=None):
+    """原生 Neo4j 驱动执行器：通过进程共享的连接池执行只读查询，返回字典列表"""
+    cached_rows = result_cache.get(query, params)
+    if cached_rows is not None:
+        return cached_rows
+    graph_version = get_graph_version()
+    rows = run_read_query(query, params)
+    if rows and not has_order_by(query):
+        rows = sort_graph_rows(rows)
+    if rows is not None:
+        result_cache.set(query, params, rows, graph_version)
+    return rows
 
 
 # ==========================================
@@ -55,15 +58,20 @@ MANUAL_SCHEMA = """
 # 3. 配置 LLM
 # ==========================================
 # 升级 langchain-community 后，这里可以直接传参数，不会报错了
-llm = ChatSparkLLM(
-    spark_app_id=os.getenv('SPARKAI_APP_ID'),
-    spark_api_key=os.getenv('SPARKAI_API_KEY'),
-    spark_api_secret=os.getenv('SPARKAI_API_SECRET'),
-    spark_api_url='wss://spark-api.xf-yun.com/v4.0/chat',
-    spark_llm_domain='4.0Ultra',
-    temperature=0.1,  # 直接写，没问题
-    top_k=4
-)
+def create_cypher_llm() -> ChatSparkLLM:
+    return ChatSparkLLM(
+        spark_app_id=os.getenv('SPARKAI_APP_ID'),
+        spark_api_key=os.getenv('SPARKAI_API_KEY'),
+        spark_api_secret=os.getenv('SPARKAI_API_SECRET'),
+        spark_api_url='wss://spark-api.xf-yun.com/v4.0/chat',
+        spark_llm_domain='4.0Ultra',
+        temperature=0.1,  # 直接写，没问题
+        top_k=4
+    )
+
+
+# ChatSparkLLM 的结果队列挂在实例上，并发的图谱查询各自独占一个实例
+llm_pool = LLMClientPool(create_cypher_llm, size=int(os.getenv("GRAPH_LLM_POOL_SIZE", "4")))
 
 PROMPT_TEMPLATE = """
 你是一个 Neo4j 专家。请根据 Schema 编写 Cypher 查询。
@@ -84,23 +92,57 @@ PROMPT_TEMPLATE = """
 
 prompt = PromptTemplate(input_variables=["schema", "question"], template=PROMPT_TEMPLATE)
 
+# 同一形状的问题（如“<major>学费是多少”）复用已验证过的参数化 Cypher
+template_cache = CypherTemplateCache()
+# LLM 生成的 Cypher 执行前的校验（写操作、EXPLAIN 预估行数、自动 LIMIT）
+cypher_guard = CypherGuard(explain_query)
+
 
 # ==========================================
 # 4. 问答主逻辑
 # ==========================================
-def query_graph(user_query: str):
-    try:
-        # 第一步：LLM 生成 Cypher
-        full_prompt = prompt.format(schema=MANUAL_SCHEMA, question=user_query)
+def generate_cypher(user_query: str) -> str:
+    full_prompt = prompt.format(schema=MANUAL_SCHEMA, question=user_query)
+    with llm_pool.acquire() as llm:
         response = llm.invoke(full_prompt)  # 最新版推荐用 invoke
-        cypher_query = response.content.strip()
+    cypher_query = response.content.strip()
+
+    # 清洗结果
+    return cypher_query.replace("```cypher", "").replace("```", "")
 
-        # 清洗结果
-        cypher_query = cypher_query.replace("```cypher", "").replace("```", "")
+
+def query_graph(user_query: str):
+    try:
+        # 第零步：同形状的问题命中模板时，代入新参数直接执行，跳过 LLM。
+        # 模板同样经过校验（已批准的语句不再 EXPLAIN）；执行失败或没有数据时视为未命中，移除模板并回退到 LLM
+        shape = template_cache.extract_shape(user_query)
+        template = template_cache.get(shape)
+        if template:
+            print(f"\n[Cypher模板命中]: {template.cypher} 参数: {shape.params}")
+            verdict = cypher_guard.check(template.cypher, shape.params)
+            if verdict.allowed:
+                # 模板只以校验后（已补 LIMIT）的形式保存，校验不应再改写它
+                assert verdict.cypher == template.cypher, "Cypher 模板未经校验就被保存"
+                result = run_cypher(template.cypher, shape.params)
+                if result:
+                    return result
+            else:
+                print(f"[Cypher模板校验未通过]: {verdict.reason}")
+            template_cache.discard(shape)
+
+        # 第一步：LLM 生成 Cypher，并在执行前校验
+        cypher_query = generate_cypher(user_query)
         print(f"\n[AI生成的Cypher]: {cypher_query}")
+        verdict = cypher_guard.check(cypher_query)
+        if not verdict.allowed:
+            print(f"[Cypher校验未通过，已拒绝执行]: {verdict.reason}")
+            return None
+        cypher_query = verdict.cypher
 
-        # 第二步：执行 Cypher
+        # 第二步：执行 Cypher；执行成功且有数据时把校验后的语句保存为模板
         result = run_cypher(cypher_query)
+        if result:
+            template_cache.store(shape, cypher_query)
         return result
 
     except Exception as e:
@@ -108,6 +150,11 @@ def query_graph(user_query: str):
         return None
 
 
+def get_graph_service_stats():
+    return {"cypher_templates": template_cache.get_stats(), "cypher_results": result_cache.get_stats(),
+            "cypher_guard": cypher_guard.get_stats(), "llm_pool": llm_pool.get_stats()}
+
+
 # ==========================================
 # 5. 测试运行
 # ==========================================
@@ -0,0 +1,104 @@
+# intent_fast_path.py
+# 本地词典意图快速通道：用 Aho-Corasick 自动机在本地识别招生类型、收费/分数线意图、系和专业，
+# 只有置信度不足的问题才交给 LLM 意图分类。
+import threading
+from typing import Dict, List, Optional, Union
+
+from knowledge_extractor.aho_corasick import AhoCorasickAutomaton
+from knowledge_extractor.config import ENTITY_DICTIONARIES
+
+# 置信度达到该阈值时直接采用本地识别结果，不再调用 LLM
+FAST_PATH_CONFIDENCE_THRESHOLD = 0.8
+
+FEE_KEYWORDS = ["学费", "收费", "费用", "住宿费", "缴费", "交费", "多少钱", "交多少", "收费标准", "代办费"]
+SCORE_KEYWORDS = ["分数线", "录取分数", "分数", "最低分", "最高分", "投档线", "录取线", "位次", "省排名"]
+ENROLLMENT_KEYWORDS = {"专升本": "专升本", "本科": "本科"}
+
+
+class LocalIntentMatcher:
+    """基于已知系/专业/收费/分数关键词的本地意图识别器"""
+
+    def __init__(self, departments_majors: Dict[str, List[str]], known_majors: List[str]):
+        self._lock = threading.Lock()
+        self._stats = {"total_queries": 0, "fast_path_answered": 0, "llm_fallbacks": 0}
+        self.rebuild(departments_majors, known_majors)
+
+    def rebuild(self, departments_majors: Dict[str, List[str]], known_majors: List[str]):
+        """系/专业列表变化时（如事实快照重新加载）重建词典，统计数据保留"""
+        automaton = AhoCorasickAutomaton()
+        for department in departments_majors:
+            automaton.add(department, ("DEPARTMENT", department))
+        for major in known_majors:
+            automaton.add(major, ("MAJOR", major))
+        for term in FEE_KEYWORDS + ENTITY_DICTIONARIES.get("FEE_ITEM", []):
+            automaton.add(term, ("FEE", term))
+        for term in SCORE_KEYWORDS + ENTITY_DICTIONARIES.get("ADMISSION_GROUP", []):
+            automaton.add(term, ("SCORE", term))
+        for term, enrollment_type in ENROLLMENT_KEYWORDS.items():
+            automaton.add(term, ("ENROLLMENT", enrollment_type))
+        automaton.build()
+
+        self.departments_majors = departments_majors
+        self._automaton = automaton
+
+    def match(self, user_query: str) -> Dict[str, Union[str, bool, float, None]]:
+        """
+        本地识别意图，返回与 analyze_query_intent 相同的字段，外加 confidence (0~1)。
+        """
+        departments, majors, enrollment_types = [], [], []
+        has_fee, has_score = False, False
+        for _, _, (kind, value) in self._automaton.find_longest(user_query):
+            if kind == "DEPARTMENT" and value not in departments:
+                departments.append(value)
+            elif kind == "MAJOR" and value not in majors:
+                majors.append(value)
+            elif kind == "ENROLLMENT" and value not in enrollment_types:
+                enrollment_types.append(value)
+            elif kind == "FEE":
+                has_fee = True
+            elif kind == "SCORE":
+                has_score = True
+
+        department: Optional[str] = departments[0] if len(departments) == 1 else None
+        major: Optional[str] = majors[0] if len(majors) == 1 and not department else None
+
+        if len(departments) > 1 or len(majors) > 1 or len(enrollment_types) > 1:
+            # 同时出现多个系/专业/招生类型，需要 LLM 判断“唯一最匹配”的那个
+            confidence = 0.4
+        elif department and majors and majors[0] not in self.departments_majors.get(department, []):
+            # 系与专业不一致，交给 LLM
+            confidence = 0.5
+        elif department or majors:
+            confidence = 0.9
+        elif has_fee or has_score:
+            confidence = 0.8
+        elif enrollment_types:
+            confidence = 0.7
+        else:
+            # 没有任何词典信号，无法区分“通用问题”和换了说法的专业/收费问题
+            confidence = 0.0
+
+        return {
+            "enrollment_type": enrollment_types[0] if len(enrollment_types) == 1 else "通用",
+            "is_score_query": has_score,
+            "is_fee_query": has_fee,
+            "department": department,
+            "major": major,
+            "confidence": confidence,
+        }
+
+    def record_outcome(self, answered_locally: bool):
+        """记录本次意图识别是否由快速通道独立完成"""
+        with self._lock:
+            self._stats["total_queries"] += 1
+            if answered_locally:
+                self._stats["fast_path_answered"] += 1
+            else:
+                self._stats["llm_fallbacks"] += 1
+
+    def get_stats(self) -> Dict[str, Union[int, float]]:
+        with self._lock:
+            stats = dict(self._stats)
+        total = stats["total_queries"]
+        stats["fast_path_hit_rate"] = round(stats["fast_path_answered"] / total, 4) if total else 0.0
+        return stats
@@ -0,0 +1,102 @@
+# knowledge_extractor/aho_corasick.py
+
+from collections import deque
+from typing import Any, Dict, Iterator, List, Tuple
+
+
+class AhoCorasickAutomaton:
+    """
+    字符级 Aho-Corasick 多模式匹配自动机。
+    所有词条编译进同一个自动机，对原始文本只做一次线性扫描，不依赖分词结果。
+    同一个词条可以挂多个 payload（例如同一个词同时属于 MAJOR 和 COURSE）。
+    """
+
+    def __init__(self, ignore_case: bool = True):
+        self.ignore_case = ignore_case
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # 每个状态的输出：(词条长度, payload)
+        self._outputs: List[List[Tuple[int, Any]]] = [[]]
+        self._built = False
+        self.term_count = 0
+
+    def add(self, term: str, payload: Any = None):
+        """添加一个词条；payload 缺省时为词条本身"""
+        if not term:
+            return
+        if payload is None:
+            payload = term
+        key = term.lower() if self.ignore_case else term
+        state = 0
+        for char in key:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._outputs.append([])
+            state = next_state
+        output = (len(key), payload)
+        if output not in self._outputs[state]:
+            self._outputs[state].append(output)
+            self.term_count += 1
+        self._built = False
+
+    def build(self):
+        """BFS 计算失败指针，并把失败链上的输出合并到每个状态"""
+        queue = deque()
+        for next_state in self._goto[0].values():
+            self._fail[next_state] = 0
+            queue.append(next_state)
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail_state = self._fail[state]
+                while fail_state and char not in self._goto[fail_state]:
+                    fail_state = self._fail[fail_state]
+                self._fail[next_state] = self._goto[fail_state].get(char, 0)
+                if self._fail[next_state] == next_state:
+                    self._fail[next_state] = 0
+                for output in self._outputs[self._fail[next_state]]:
+                    if output not in self._outputs[next_state]:
+                        self._outputs[next_state].append(output)
+        self._built = True
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int, Any]]:
+        """线性扫描文本，产出所有（可能重叠的）匹配：(start, end, payload)"""
+        if not self._built:
+            self.build()
+        goto, fail, outputs = self._goto, self._fail, self._outputs
+        scan_text = text.lower() if self.ignore_case else text
+        state = 0
+        for index, char in enumerate(scan_text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if outputs[state]:
+                end = index + 1
+                for length, payload in outputs[state]:
+                    yield end - length, end, payload
+
+    def find_longest(self, text: str) -> List[Tuple[int, int, Any]]:
+        """
+        最长匹配优先的重叠消解：长的匹配先占位，与已选匹配重叠的短匹配被丢弃。
+        完全相同区间上的多个 payload 会一并保留。结果按出现位置排序。
+        """
+        matches = sorted(self.iter_matches(text), key=lambda m: (m[0] - m[1], m[0]))
+        occupied = bytearray(len(text))
+        chosen_spans = set()
+        selected = []
+        for start, end, payload in matches:
+            if (start, end) in chosen_spans:
+                selected.append((start, end, payload))
+                continue
+            if any(occupied[start:end]):
+                continue
+            occupied[start:end] = b"\x01" * (end - start)
+            chosen_spans.add((start, end))
+            selected.append((start, end, payload))
+        selected.sort(key=lambda m: (m[0], m[1]))
+        return selected
@@ -10,8 +10,32 @@ NEO4J_URI = os.getenv('NEO4J_URI', "bolt://localhost:7687")
 NEO4J_USERNAME = os.getenv('NEO4J_USERNAME', "neo4j")
 NEO4J_PASSWORD = os.getenv('NEO4J_PASSWORD', "your_neo4j_password") # 请替换为你的实际密码！
 
+# --- Neo4j 连接池配置 (整个进程共享一个 driver) ---
+NEO4J_MAX_POOL_SIZE = int(os.getenv('NEO4J_MAX_POOL_SIZE', "50"))
+NEO4J_ACQUISITION_TIMEOUT = float(os.getenv('NEO4J_ACQUISITION_TIMEOUT', "10"))  # 从连接池获取连接的超时（秒）
+NEO4J_QUERY_TIMEOUT = float(os.getenv('NEO4J_QUERY_TIMEOUT', "5"))  # 单条只读查询的事务超时（秒）
+NEO4J_IMPORT_BATCH_SIZE = int(os.getenv('NEO4J_IMPORT_BATCH_SIZE', "500"))  # 导入时每个 UNWIND 批次的行数
+
 # --- SpaCy 中文模型名称 ---
 SPACY_MODEL_NAME = "zh_core_web_sm"
+# 管线模式：full 加载完整模型（tagger/parser/ner 等）；light 只保留分词器并用规则分句器分句，
+# 知识抽取只用到 PhraseMatcher 和 token Matcher，light 模式加载更快、内存更小
+SPACY_PIPELINE_MODE = os.getenv('SPACY_PIPELINE_MODE', "full")
+# light 模式下排除的组件（模型中不存在的名称会被忽略）
+SPACY_LIGHT_EXCLUDE = ["tok2vec", "tagger", "morphologizer", "parser", "attribute_ruler", "lemmatizer", "ner", "senter"]
+
+# --- 知识抽取的批量解析配置 (nlp.pipe) ---
+EXTRACTION_BATCH_SIZE = int(os.getenv('EXTRACTION_BATCH_SIZE', "16"))  # nlp.pipe 每批的文本块数
+EXTRACTION_N_PROCESS = int(os.getenv('EXTRACTION_N_PROCESS', "1"))  # 解析进程数，大于 1 时对长文档启用多进程
+EXTRACTION_MULTIPROCESS_MIN_BLOCKS = int(os.getenv('EXTRACTION_MULTIPROCESS_MIN_BLOCKS', "32"))  # 文本块少于该值时不启动子进程
+PARSE_BLOCK_MAX_CHARS = int(os.getenv('PARSE_BLOCK_MAX_CHARS', "2000"))  # 每个文本块的最大字符数（清洗前在句末标点处切分）
+
+# --- 词典实体匹配引擎 ---
+# aho_corasick：字符级自动机直接扫描原文（不依赖分词）；phrase_matcher：原先基于分词结果的 SpaCy PhraseMatcher
+ENTITY_MATCHER_ENGINE = os.getenv('ENTITY_MATCHER_ENGINE', "aho_corasick")
+# 编译好的自动机缓存文件，词典内容变化时自动重建
+ENTITY_MATCHER_CACHE_PATH = os.getenv('ENTITY_MATCHER_CACHE_PATH',
+                                      os.path.join(os.path.dirname(__file__), "cache", "entity_automaton.pkl"))
 
 # --- 知识图谱实体词典 ---
 ENTITY_DICTIONARIES = {
@@ -0,0 +1,87 @@
+# knowledge_extractor/entity_matcher.py
+
+import hashlib
+import json
+import os
+import pickle
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from .aho_corasick import AhoCorasickAutomaton
+from .config import ENTITY_DICTIONARIES, ENTITY_MATCHER_CACHE_PATH
+
+# 自动机的序列化格式变化时递增，使旧的磁盘缓存失效
+AUTOMATON_CACHE_VERSION = 1
+
+
+def dictionary_fingerprint(dictionaries: Dict[str, List[str]]) -> str:
+    payload = json.dumps({"version": AUTOMATON_CACHE_VERSION, "dictionaries": dictionaries},
+                         sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class DictionaryEntityMatcher:
+    """
+    词典实体匹配器：把 ENTITY_DICTIONARIES 中的全部词条编译进一个字符级 Aho-Corasick 自动机，
+    对原始文本做一次线性扫描并按最长匹配消解重叠，不依赖分词结果（替代 PhraseMatcher）。
+    """
+
+    def __init__(self, automaton: AhoCorasickAutomaton, fingerprint: str):
+        self.automaton = automaton
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def build(cls, dictionaries: Dict[str, List[str]]) -> "DictionaryEntityMatcher":
+        automaton = AhoCorasickAutomaton(ignore_case=True)
+        for label, terms in dictionaries.items():
+            for term in terms:
+                automaton.add(str(term), label)
+        automaton.build()
+        return cls(automaton, dictionary_fingerprint(dictionaries))
+
+    def match(self, text: str) -> List[Dict[str, Any]]:
+        """返回与 extract_entities 相同格式的记录：{"text", "label", "start", "end"}，按出现位置排序"""
+        return [{"text": text[start:end], "label": label, "start": start, "end": end}
+                for start, end, label in self.automaton.find_longest(text)]
+
+    def save(self, path: Path):
+        """先写临时文件再原子替换，避免并发启动的进程读到写了一半的缓存"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(path.suffix + f".{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as f:
+            pickle.dump({"fingerprint": self.fingerprint, "automaton": self.automaton}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: Path, fingerprint: str) -> Optional["DictionaryEntityMatcher"]:
+        """读取磁盘缓存；文件不存在、损坏或词典已变化时返回 None"""
+        try:
+            with open(path, "rb") as f:
+                cached = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"实体匹配自动机缓存 {path} 读取失败，将重新构建: {e}")
+            return None
+        if not isinstance(cached, dict) or cached.get("fingerprint") != fingerprint:
+            return None
+        return cls(cached["automaton"], fingerprint)
+
+
+def load_entity_matcher(dictionaries: Dict[str, List[str]] = ENTITY_DICTIONARIES,
+                        cache_path: Path = Path(ENTITY_MATCHER_CACHE_PATH)) -> DictionaryEntityMatcher:
+    """优先从磁盘缓存加载自动机；词典变化（指纹不同）时重新构建并写回缓存"""
+    fingerprint = dictionary_fingerprint(dictionaries)
+    matcher = DictionaryEntityMatcher.load(cache_path, fingerprint)
+    if matcher is not None:
+        print(f"实体匹配自动机已从缓存加载：{matcher.automaton.term_count} 个词条。")
+        return matcher
+
+    matcher = DictionaryEntityMatcher.build(dictionaries)
+    try:
+        matcher.save(cache_path)
+    except OSError as e:
+        print(f"实体匹配自动机缓存写入失败（不影响使用）: {e}")
+    print(f"实体匹配自动机已构建：{matcher.automaton.term_count} 个词条。")
+    return matcher
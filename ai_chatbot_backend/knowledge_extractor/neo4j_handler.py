@@ -1,35 +1,182 @@
 # knowledge_extractor/neo4j_handler.py
 
-from neo4j import GraphDatabase
+from neo4j import GraphDatabase, Query, READ_ACCESS
 from typing import List, Dict, Any, Optional
 import json  # 用于打印Cypher和参数
+import re
+import threading
+import time
 
-from .config import NEO4J_URI, NEO4J_USERNAME, NEO4J_PASSWORD, SCHEMA_MERGE_RULES
+from .config import NEO4J_URI, NEO4J_USERNAME, NEO4J_PASSWORD, SCHEMA_MERGE_RULES, \
+    NEO4J_MAX_POOL_SIZE, NEO4J_ACQUISITION_TIMEOUT, NEO4J_QUERY_TIMEOUT, NEO4J_IMPORT_BATCH_SIZE
 
 _driver = None
+_driver_lock = threading.Lock()
+_query_stats_lock = threading.Lock()
+_query_stats = {"queries": 0, "failed": 0, "in_flight": 0, "peak_in_flight": 0, "total_ms": 0.0}
+# 图谱版本号：每次导入提交后递增，图谱查询结果缓存据此判断是否失效
+_graph_version = 0
+_schema_ensured = False
+
+# 抽取结果写入的节点除 SCHEMA_MERGE_RULES 外，还有关系导入时 MERGE 的这些键
+EXTRA_SCHEMA_KEYS = [("FeeStandard", "id"), ("Year", "value")]
+_PARAM_REFERENCE_PATTERN = re.compile(r'\$(\w+)')
+_MERGE_KEY_PATTERN = re.compile(r'MERGE\s*\(\s*\w+\s*:\s*(\w+)\s*\{\s*(\w+)\s*:')
 
 
 def get_neo4j_driver():
-    """获取Neo4j驱动实例，如果不存在则初始化"""
+    """获取进程共享的Neo4j驱动实例（自带连接池），如果不存在则初始化"""
     global _driver
     if _driver is None:
-        try:
-            _driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USERNAME, NEO4J_PASSWORD))
-            _driver.verify_connectivity()
-            print("Neo4j driver initialized and connected.")
-        except Exception as e:
-            print(f"Error connecting to Neo4j: {e}")
-            _driver = None  # 确保连接失败时驱动为None
+        with _driver_lock:
+            if _driver is None:
+                try:
+                    driver = GraphDatabase.driver(
+                        NEO4J_URI,
+                        auth=(NEO4J_USERNAME, NEO4J_PASSWORD),
+                        max_connection_pool_size=NEO4J_MAX_POOL_SIZE,
+                        connection_acquisition_timeout=NEO4J_ACQUISITION_TIMEOUT
+                    )
+                    driver.verify_connectivity()
+                    _driver = driver
+                    print("Neo4j driver initialized and connected.")
+                except Exception as e:
+                    print(f"Error connecting to Neo4j: {e}")
+                    _driver = None  # 确保连接失败时驱动为None
     return _driver
 
 
 def close_neo4j_driver():
     """关闭Neo4j驱动"""
     global _driver
-    if _driver:
-        _driver.close()
-        _driver = None
-        print("Neo4j driver closed.")
+    with _driver_lock:
+        if _driver:
+            _driver.close()
+            _driver = None
+            print("Neo4j driver closed.")
+
+
+def run_read_query(query: str, params: Optional[Dict[str, Any]] = None,
+                   timeout: float = NEO4J_QUERY_TIMEOUT) -> Optional[List[Dict[str, Any]]]:
+    """
+    通过共享驱动执行只读查询，返回字典列表；驱动不可用或查询失败时返回 None。
+    连接从连接池借出，不再为每次查询重新握手和认证。
+    """
+    driver = get_neo4j_driver()
+    if not driver:
+        print("Neo4j driver not available. Query skipped.")
+        return None
+
+    with _query_stats_lock:
+        _query_stats["queries"] += 1
+        _query_stats["in_flight"] += 1
+        _query_stats["peak_in_flight"] = max(_query_stats["peak_in_flight"], _query_stats["in_flight"])
+    started = time.perf_counter()
+    try:
+        with driver.session(default_access_mode=READ_ACCESS) as session:
+            return session.execute_read(
+                lambda tx: [dict(record) for record in tx.run(Query(query, timeout=timeout), params or {})]
+            )
+    except Exception as e:
+        with _query_stats_lock:
+            _query_stats["failed"] += 1
+        print(f"执行 Cypher 报错: {e}")
+        return None
+    finally:
+        with _query_stats_lock:
+            _query_stats["in_flight"] -= 1
+            _query_stats["total_ms"] += (time.perf_counter() - started) * 1000
+
+
+def explain_query(query: str, params: Optional[Dict[str, Any]] = None,
+                  timeout: float = NEO4J_QUERY_TIMEOUT) -> Optional[Dict[str, Any]]:
+    """
+    对查询执行 EXPLAIN（只生成执行计划，不真正执行），返回计划树字典。
+    驱动不可用时返回 None；语法错误等异常直接抛出，由调用方决定如何处理。
+    """
+    driver = get_neo4j_driver()
+    if not driver:
+        return None
+    with driver.session(default_access_mode=READ_ACCESS) as session:
+        result = session.run(Query(f"EXPLAIN {query}", timeout=timeout), params or {})
+        return result.consume().plan
+
+
+def required_schema_keys() -> List[tuple]:
+    """抽取器写入的全部 (标签, 键) 组合，按 MERGE 规则中出现的顺序去重"""
+    keys = []
+    for rule in SCHEMA_MERGE_RULES.values():
+        for label, key in _MERGE_KEY_PATTERN.findall(rule):
+            if (label, key) not in keys:
+                keys.append((label, key))
+    for label, key in EXTRA_SCHEMA_KEYS:
+        if (label, key) not in keys:
+            keys.append((label, key))
+    return keys
+
+
+def ensure_graph_schema() -> Dict[str, List[str]]:
+    """
+    幂等地为每个 (标签, 键) 创建唯一性约束（自带索引），使 MERGE/MATCH 走索引查找而不是全标签扫描。
+    已有重复数据导致约束无法创建时退而创建普通索引。返回仍然缺失约束和索引的组合。
+    """
+    global _schema_ensured
+    driver = get_neo4j_driver()
+    if not driver:
+        print("Neo4j driver not available. Schema bootstrap skipped.")
+        return {"missing": []}
+
+    keys = required_schema_keys()
+    with driver.session() as session:
+        for label, key in keys:
+            name = f"{label.lower()}_{key}"
+            try:
+                session.run(f"CREATE CONSTRAINT {name}_unique IF NOT EXISTS "
+                            f"FOR (n:{label}) REQUIRE n.{key} IS UNIQUE").consume()
+            except Exception as e:
+                print(f"无法为 {label}.{key} 创建唯一性约束（{e}），改为创建普通索引。")
+                try:
+                    session.run(f"CREATE INDEX {name}_index IF NOT EXISTS FOR (n:{label}) ON (n.{key})").consume()
+                except Exception as index_error:
+                    print(f"为 {label}.{key} 创建索引失败: {index_error}")
+
+        indexed = set()
+        for record in session.run("SHOW INDEXES YIELD labelsOrTypes, properties"):
+            if record["labelsOrTypes"] and record["properties"] and len(record["properties"]) == 1:
+                for label in record["labelsOrTypes"]:
+                    indexed.add((label, record["properties"][0]))
+
+    missing = [f"{label}.{key}" for label, key in keys if (label, key) not in indexed]
+    if missing:
+        print(f"警告: 以下图谱键仍缺少约束/索引，相关查找将退化为全标签扫描: {', '.join(missing)}")
+    else:
+        print(f"图谱 Schema 检查完成：{len(keys)} 个标签/键均已建立约束或索引。")
+        _schema_ensured = True
+    return {"missing": missing}
+
+
+def get_graph_version() -> int:
+    return _graph_version
+
+
+def bump_graph_version() -> int:
+    global _graph_version
+    with _query_stats_lock:
+        _graph_version += 1
+        return _graph_version
+
+
+def get_neo4j_pool_stats() -> Dict[str, Any]:
+    """连接池配置和只读查询的统计信息"""
+    with _query_stats_lock:
+        stats = dict(_query_stats)
+    stats["avg_ms"] = round(stats["total_ms"] / stats["queries"], 1) if stats["queries"] else None
+    stats["total_ms"] = round(stats["total_ms"], 1)
+    stats["driver_connected"] = _driver is not None
+    stats["max_pool_size"] = NEO4J_MAX_POOL_SIZE
+    stats["acquisition_timeout"] = NEO4J_ACQUISITION_TIMEOUT
+    stats["query_timeout"] = NEO4J_QUERY_TIMEOUT
+    return stats
 
 
 def generate_cypher_for_entity(entity: Dict[str, Any]) -> Optional[Dict[str, Any]]:
@@ -140,15 +287,36 @@ def generate_cypher_for_relation(relation: Dict[str, Any]) -> Optional[Dict[str,
     return None
 
 
-def import_extracted_data_to_neo4j(extracted_data: Dict[str, List[Dict[str, Any]]], batch_size: int = 50):
+def group_cypher_ops_for_unwind(cypher_ops: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    把语句相同、只有参数不同的操作合并为一组：语句中的 $param 改写为 row.param，
+    整组作为一条 UNWIND $rows AS row ... 语句执行。组的顺序按首次出现排列（实体在前、关系在后）。
+    """
+    groups: Dict[str, Dict[str, Any]] = {}
+    for op in cypher_ops:
+        query_key = " ".join(op["query"].split())
+        group = groups.get(query_key)
+        if group is None:
+            unwind_query = "UNWIND $rows AS row " + _PARAM_REFERENCE_PATTERN.sub(r"row.\1", query_key)
+            group = groups[query_key] = {"query": unwind_query, "rows": []}
+        group["rows"].append(op["params"])
+    return list(groups.values())
+
+
+def import_extracted_data_to_neo4j(extracted_data: Dict[str, List[Dict[str, Any]]],
+                                   batch_size: int = NEO4J_IMPORT_BATCH_SIZE) -> Dict[str, int]:
     """
     将抽取到的实体和关系数据导入Neo4j。
-    使用事务分批提交以提高效率。
+    同一语句的操作合并为 UNWIND 批量写入，服务器只需为每种语句生成一次执行计划；
+    某个批次失败时记录下来并继续导入其余批次。返回批次统计。
     """
+    stats = {"operations": 0, "statements": 0, "batches": 0, "failed_batches": 0, "failed_rows": 0}
     driver = get_neo4j_driver()
     if not driver:
         print("Neo4j driver not available. Data import skipped.")
-        return
+        return stats
+    if not _schema_ensured:
+        ensure_graph_schema()
 
     all_cypher_ops = []  # 存储所有待执行的Cypher查询和参数
 
@@ -164,25 +332,33 @@ def import_extracted_data_to_neo4j(extracted_data: Dict[str, List[Dict[str, Any]
         if cypher_op:
             all_cypher_ops.append(cypher_op)
 
-    print(f"Generated {len(all_cypher_ops)} Cypher operations.")
+    # 3. 按语句分组
+    statement_groups = group_cypher_ops_for_unwind(all_cypher_ops)
+    stats["operations"] = len(all_cypher_ops)
+    stats["statements"] = len(statement_groups)
+    print(f"Generated {len(all_cypher_ops)} Cypher operations in {len(statement_groups)} UNWIND statements.")
 
-    # 3. 分批执行
+    # 4. 分批执行
+    started = time.perf_counter()
     with driver.session() as session:
-        for i in range(0, len(all_cypher_ops), batch_size):
-            batch_ops = all_cypher_ops[i:i + batch_size]
+        for group in statement_groups:
+            rows = group["rows"]
+            for i in range(0, len(rows), batch_size):
+                batch_rows = rows[i:i + batch_size]
+                stats["batches"] += 1
+                try:
+                    session.execute_write(lambda tx: tx.run(group["query"], rows=batch_rows).consume())
+                except Exception as e:
+                    # 失败的批次整体回滚，记录后继续导入其余批次
+                    stats["failed_batches"] += 1
+                    stats["failed_rows"] += len(batch_rows)
+                    print(f"Error committing UNWIND batch ({len(batch_rows)} rows). Error: {e}")
+                    print(f"  Failed Query: {group['query']}")
+                    print(f"  First Failed Params: {json.dumps(batch_rows[0], ensure_ascii=False)}")
 
-            try:
-                with session.begin_transaction() as tx:
-                    for op in batch_ops:
-                        tx.run(op["query"], op["params"])
-                print(f"Batch {i // batch_size + 1}/{len(all_cypher_ops) // batch_size + 1} committed successfully.")
-            except Exception as e:
-                print(f"Error committing batch {i // batch_size + 1}. Error: {e}")
-                # 可以在这里添加更详细的日志记录，如具体的失败查询
-                for op in batch_ops:
-                    print(f"  Failed Query: {op['query']}")
-                    print(f"  Failed Params: {json.dumps(op['params'], ensure_ascii=False)}")
-                # 出现错误回滚整个批次，并停止后续导入
-                raise
-
-    print("数据导入Neo4j完成。")
\ No newline at end of file
+    # 有批次提交成功即说明图谱已变化，使图谱查询结果缓存失效
+    if stats["batches"] > stats["failed_batches"]:
+        bump_graph_version()
+    print(f"数据导入Neo4j完成：{stats['batches']} 个批次（失败 {stats['failed_batches']} 个），"
+          f"耗时 {time.perf_counter() - started:.2f}s。")
+    return stats
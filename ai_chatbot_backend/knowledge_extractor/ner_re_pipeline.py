@@ -1,52 +1,74 @@
 # knowledge_extractor/ner_re_pipeline.py
 
+import json
 import re
+from bisect import bisect_left, bisect_right
+import threading
+import time
 import spacy
-from spacy.matcher import PhraseMatcher, Matcher
-from typing import List, Dict, Any
+from spacy.matcher import PhraseMatcher
+from typing import List, Dict, Any, Iterator, Optional
 
-from .config import ENTITY_DICTIONARIES, REGEX_PATTERNS, RELATION_KEYWORDS
-from .text_processor import load_spacy_model
+from .config import ENTITY_DICTIONARIES, RELATION_KEYWORDS, EXTRACTION_BATCH_SIZE, \
+    EXTRACTION_N_PROCESS, EXTRACTION_MULTIPROCESS_MIN_BLOCKS, PARSE_BLOCK_MAX_CHARS, ENTITY_MATCHER_ENGINE
+from .text_processor import load_spacy_model, split_into_parse_blocks
+from .entity_matcher import load_entity_matcher
+from .regex_scanner import RegexEntityScanner
 
 _nlp = None
 _phrase_matcher = None
-_regex_matcher = None
+_entity_matcher = None
+_regex_scanner = None
 
+# 累计的抽取吞吐统计
+_extraction_stats = {"documents": 0, "chars": 0, "sentences": 0, "entities": 0, "relations": 0, "seconds": 0.0}
+_extraction_stats_lock = threading.Lock()
 
-def init_ner_re_components():
-    global _nlp, _phrase_matcher, _regex_matcher
-    if _nlp is None:
-        _nlp = load_spacy_model()
 
-        # 1. 词典匹配
-        _phrase_matcher = PhraseMatcher(_nlp.vocab, attr="LOWER")
-        for label, terms in ENTITY_DICTIONARIES.items():
-            patterns = [_nlp.make_doc(str(t)) for t in terms]
-            _phrase_matcher.add(label, patterns)
+def init_ner_re_components(nlp=None):
+    """
+    初始化词典和正则匹配器。传入 nlp 时改用该管线并重建匹配器（基准测试中切换 full/light 管线时使用）。
+    """
+    global _nlp, _phrase_matcher, _entity_matcher, _regex_scanner
+    if nlp is not None or _nlp is None:
+        _nlp = nlp if nlp is not None else load_spacy_model()
 
-        # 2. 正则匹配
-        _regex_matcher = Matcher(_nlp.vocab)
-        for label, regex in REGEX_PATTERNS.items():
-            _regex_matcher.add(label, [[{"TEXT": {"REGEX": regex}}]])
+        # 1. 词典匹配（默认使用字符级自动机，与管线无关，只构建一次）
+        if ENTITY_MATCHER_ENGINE == "phrase_matcher":
+            _phrase_matcher = PhraseMatcher(_nlp.vocab, attr="LOWER")
+            for label, terms in ENTITY_DICTIONARIES.items():
+                patterns = [_nlp.make_doc(str(t)) for t in terms]
+                _phrase_matcher.add(label, patterns)
+        elif _entity_matcher is None:
+            _entity_matcher = load_entity_matcher()
+
+        # 2. 正则匹配（合并为一个正则，直接扫描原文）
+        if _regex_scanner is None:
+            _regex_scanner = RegexEntityScanner()
 
 
 def extract_entities(text: str) -> List[Dict[str, Any]]:
     if _nlp is None: init_ner_re_components()
-    doc = _nlp(text)
+    return extract_entities_from_doc(_nlp(text))
+
+
+def extract_entities_from_doc(doc: spacy.tokens.Doc) -> List[Dict[str, Any]]:
+    """在已解析的 Doc 上做词典和正则匹配，不再重复解析文本"""
+    if _nlp is None: init_ner_re_components()
     entities = []
 
-    # PhraseMatcher
-    for match_id, start, end in _phrase_matcher(doc):
-        span = doc[start:end]
-        entities.append(
-            {"text": span.text, "label": _nlp.vocab.strings[match_id], "start": span.start_char, "end": span.end_char})
+    # 词典匹配：字符级自动机（最长匹配优先）或 PhraseMatcher
+    if ENTITY_MATCHER_ENGINE == "phrase_matcher":
+        for match_id, start, end in _phrase_matcher(doc):
+            span = doc[start:end]
+            entities.append(
+                {"text": span.text, "label": _nlp.vocab.strings[match_id], "start": span.start_char,
+                 "end": span.end_char})
+    else:
+        entities.extend(_entity_matcher.match(doc.text))
 
-    # RegexMatcher
-    for match_id, start, end in _regex_matcher(doc):
-        span = doc[start:end]
-        label = _nlp.vocab.strings[match_id]
-        text_val = span.text.replace("元", "") if label == "MONEY_AMOUNT" else span.text
-        entities.append({"text": text_val, "label": label, "start": span.start_char, "end": span.end_char})
+    # 正则匹配：单次 finditer 扫描原文
+    entities.extend(_regex_scanner.scan(doc.text))
 
     # 去重
     unique_ents = []
@@ -62,9 +84,47 @@ def extract_entities(text: str) -> List[Dict[str, Any]]:
     return unique_ents
 
 
+# 基于关键词的实体对关系只考虑起点相距不超过该字符数的实体
+RELATION_WINDOW_CHARS = 100
+
+
+class KeywordIntervalIndex:
+    """
+    预先找出文本中所有关键词出现的位置，之后“区间 [s, e) 内是否包含任一关键词”只需一次二分查找，
+    代替对每个实体对切片 doc.text 再逐个关键词做子串查找。
+    """
+
+    def __init__(self, text: str, keywords: List[str]):
+        # 空关键词是任意文本的子串
+        self.always = any(not keyword for keyword in keywords)
+        occurrences = []
+        for keyword in set(k for k in keywords if k):
+            position = text.find(keyword)
+            while position != -1:
+                occurrences.append((position, position + len(keyword)))
+                position = text.find(keyword, position + 1)
+        occurrences.sort()
+        self.starts = [start for start, _ in occurrences]
+        # suffix_min_end[i]：起点不早于 starts[i] 的所有出现中最早的结束位置
+        self.suffix_min_end = [end for _, end in occurrences]
+        for i in range(len(occurrences) - 2, -1, -1):
+            self.suffix_min_end[i] = min(self.suffix_min_end[i], self.suffix_min_end[i + 1])
+
+    def contains_any(self, start: int, end: int) -> bool:
+        if self.always:
+            return True
+        i = bisect_left(self.starts, start)
+        return i < len(self.starts) and self.suffix_min_end[i] <= end
+
+
 def extract_relations(doc: spacy.tokens.Doc, entities: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     relations = []
 
+    # 基于关键词的关系（专业 -> 课程）：课程实体按起点排序，用二分查找取出窗口内的候选
+    courses = sorted(((ent['start'], j) for j, ent in enumerate(entities) if ent['label'] == 'COURSE'))
+    course_starts = [start for start, _ in courses]
+    covers_course_keywords = None
+
     # --- 关键逻辑：上下文记忆 ---
     # 用来解决表格合并单元格的问题：如果前面提到了"信息技术系"，后面紧跟的专业都默认属于它
     current_department = None
@@ -119,21 +179,95 @@ def extract_relations(doc: spacy.tokens.Doc, entities: List[Dict[str, Any]]) ->
                             pass
 
         # 4. 其他普通关系 (基于关键词)
-        for j, target_ent in enumerate(entities):
+        # 如果距离较近（起点相距不超过窗口）且中间文本含有关键词，就建立关系
+        if ent['label'] != 'MAJOR' or not courses:
+            continue
+        low = bisect_left(course_starts, ent['start'] - RELATION_WINDOW_CHARS)
+        high = bisect_right(course_starts, ent['start'] + RELATION_WINDOW_CHARS)
+        if low == high:
+            continue
+        if covers_course_keywords is None:
+            covers_course_keywords = KeywordIntervalIndex(doc.text, RELATION_KEYWORDS['COVERS_COURSE'])
+        # 按实体原有顺序输出，与逐对比较的结果顺序一致
+        for j in sorted(index for _, index in courses[low:high]):
             if i == j: continue
+            target_ent = entities[j]
 
-            # 这里简化逻辑，如果距离较近且有关键词，就建立关系
-            # 计算距离 (简单的字符距离)
-            dist = abs(ent['start'] - target_ent['start'])
-            if dist > 100: continue  # 太远的不看
-
-            # 获取中间文本
+            # 中间文本的区间
             s, e = sorted([ent['end'], target_ent['start']]) if ent['start'] < target_ent['start'] else sorted(
                 [target_ent['end'], ent['start']])
-            text_between = doc.text[s:e]
+            if covers_course_keywords.contains_any(s, e):
+                relations.append({"source": ent, "target": target_ent, "type": "COVERS_COURSE"})
+
+    return relations
+
+
+def iter_sentence_docs(text: str, batch_size: int = EXTRACTION_BATCH_SIZE,
+                       n_process: int = EXTRACTION_N_PROCESS) -> Iterator[spacy.tokens.Doc]:
+    """
+    text 为未经 clean_text 的原始文本：先在句末标点处切成文本块并逐块清洗，
+    再用 nlp.pipe 批量解析（每段文字只解析一次），逐句产出独立的 Doc。
+    Span.as_doc 只复制已有的解析结果，不会再次运行模型。
+    """
+    if _nlp is None: init_ner_re_components()
+    _nlp.max_length = 2000000
+    blocks = split_into_parse_blocks(text, PARSE_BLOCK_MAX_CHARS)
+    if len(blocks) < EXTRACTION_MULTIPROCESS_MIN_BLOCKS:
+        n_process = 1  # 文本块太少时子进程的启动开销大于收益
+    for block_doc in _nlp.pipe(blocks, batch_size=batch_size, n_process=n_process):
+        for sent in block_doc.sents:
+            if sent.text.strip():
+                yield sent.as_doc()
+
+
+def _dedupe(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    unique = {json.dumps(item, sort_keys=True, ensure_ascii=False) for item in items}
+    return [json.loads(item) for item in unique]
+
+
+def extract_knowledge(text: str, batch_size: int = EXTRACTION_BATCH_SIZE,
+                      n_process: Optional[int] = None) -> Dict[str, Any]:
+    """
+    对整篇原始文本（无需事先 clean_text）做实体和关系抽取：每个句子只解析一次，
+    同一个 Doc 同时用于实体匹配和 extract_relations。
+    返回 {"entities": [...], "relations": [...], "stats": 本文档的吞吐统计}，实体和关系已去重。
+    """
+    started_at = time.perf_counter()
+    all_entities = []
+    all_relations = []
+    sentence_count = 0
+    for doc in iter_sentence_docs(text, batch_size, EXTRACTION_N_PROCESS if n_process is None else n_process):
+        entities = extract_entities_from_doc(doc)
+        all_entities.extend(entities)
+        all_relations.extend(extract_relations(doc, entities))
+        sentence_count += 1
+
+    entities = _dedupe(all_entities)
+    relations = _dedupe(all_relations)
+    seconds = time.perf_counter() - started_at
+    stats = {
+        "chars": len(text),
+        "sentences": sentence_count,
+        "entities": len(entities),
+        "relations": len(relations),
+        "seconds": round(seconds, 3),
+        "chars_per_second": round(len(text) / seconds) if seconds else None,
+        "sentences_per_second": round(sentence_count / seconds, 1) if seconds else None,
+    }
+    with _extraction_stats_lock:
+        _extraction_stats["documents"] += 1
+        for key in ("chars", "sentences", "entities", "relations"):
+            _extraction_stats[key] += stats[key]
+        _extraction_stats["seconds"] += seconds
+    return {"entities": entities, "relations": relations, "stats": stats}
 
-            if ent['label'] == 'MAJOR' and target_ent['label'] == 'COURSE':
-                if any(k in text_between for k in RELATION_KEYWORDS['COVERS_COURSE']):
-                    relations.append({"source": ent, "target": target_ent, "type": "COVERS_COURSE"})
 
-    return relations
\ No newline at end of file
+def get_extraction_stats() -> Dict[str, Any]:
+    with _extraction_stats_lock:
+        stats = dict(_extraction_stats)
+    seconds = stats["seconds"]
+    stats["seconds"] = round(seconds, 3)
+    stats["chars_per_second"] = round(stats["chars"] / seconds) if seconds else None
+    stats["sentences_per_second"] = round(stats["sentences"] / seconds, 1) if seconds else None
+    stats["entity_matcher"] = ENTITY_MATCHER_ENGINE
+    return stats
@@ -0,0 +1,36 @@
+# knowledge_extractor/regex_scanner.py
+
+import re
+from typing import Any, Dict, List
+
+from .config import REGEX_PATTERNS
+
+
+class RegexEntityScanner:
+    """
+    把 REGEX_PATTERNS 合并为一个带命名分组的正则，对原始文本做一次 finditer 扫描，
+    偏移量直接取自原文，不依赖分词结果（“20000元”这类嵌在长 token 中的片段也能识别）。
+    以 ASCII 模式编译：否则中文字符属于 \\w，“2024年”中的 \\b 将无法匹配。
+    """
+
+    def __init__(self, patterns: Dict[str, str] = REGEX_PATTERNS):
+        self._patterns = {label: re.compile(pattern, re.ASCII) for label, pattern in patterns.items()}
+        self._combined = re.compile(
+            "|".join(f"(?P<{label}>{pattern})" for label, pattern in patterns.items()), re.ASCII)
+
+    def scan(self, text: str) -> List[Dict[str, Any]]:
+        """
+        返回与 extract_entities 相同格式的记录。合并后的正则在每个位置只会选中一个分支，
+        因此命中后在同一起点逐个尝试各模式，使同一片段可以同时得到多个标签（如“2024”既是 YEAR 也是 MONEY_AMOUNT）。
+        """
+        entities = []
+        for match in self._combined.finditer(text):
+            start = match.start()
+            for label, pattern in self._patterns.items():
+                label_match = pattern.match(text, start)
+                if not label_match or label_match.end() == start:
+                    continue
+                value = label_match.group(0)
+                entities.append({"text": value.replace("元", "") if label == "MONEY_AMOUNT" else value,
+                                 "label": label, "start": start, "end": label_match.end()})
+        return entities
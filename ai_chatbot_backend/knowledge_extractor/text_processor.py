@@ -6,21 +6,37 @@ import spacy
 from pathlib import Path
 from typing import List, Optional
 
+from .config import SPACY_PIPELINE_MODE, SPACY_LIGHT_EXCLUDE
+
 # 全局变量用于存储SpaCy模型，避免重复加载
 _nlp = None
 
 
+def build_spacy_pipeline(model_name: str = "zh_core_web_sm", mode: str = SPACY_PIPELINE_MODE):
+    """
+    按模式构建一个新的 SpaCy 管线（不缓存）。
+    light 模式排除 tagger/parser/ner 等组件，只保留模型自带的分词器，再加上规则分句器。
+    知识抽取时的句子边界主要来自 split_into_parse_blocks（清洗前在“。！？”处切块），
+    分句器只能看到清洗后仍保留的 ASCII “!?”，在块内补充切分。
+    """
+    exclude = SPACY_LIGHT_EXCLUDE if mode == "light" else []
+    try:
+        nlp = spacy.load(model_name, exclude=exclude)
+    except OSError:
+        print(f"SpaCy model '{model_name}' not found. Downloading...")
+        spacy.cli.download(model_name)
+        nlp = spacy.load(model_name, exclude=exclude)
+    if mode == "light" and "sentencizer" not in nlp.pipe_names:
+        nlp.add_pipe("sentencizer", config={"punct_chars": ["。", "！", "？", "!", "?"]})  # 同时适用于未清洗的文本
+    return nlp
+
+
 def load_spacy_model(model_name="zh_core_web_sm"):
-    """加载SpaCy模型，如果已加载则直接返回"""
+    """加载SpaCy模型（模式由 SPACY_PIPELINE_MODE 决定），如果已加载则直接返回"""
     global _nlp
     if _nlp is None:
-        try:
-            _nlp = spacy.load(model_name)
-            print(f"SpaCy model '{model_name}' loaded successfully.")
-        except OSError:
-            print(f"SpaCy model '{model_name}' not found. Downloading...")
-            spacy.cli.download(model_name)
-            _nlp = spacy.load(model_name)
+        _nlp = build_spacy_pipeline(model_name)
+        print(f"SpaCy model '{model_name}' loaded successfully ({SPACY_PIPELINE_MODE} mode, pipes: {_nlp.pipe_names}).")
     return _nlp
 
 
@@ -111,6 +127,39 @@ def clean_text(text: str) -> str:
     return text.strip()
 
 
+_SENTENCE_END_PATTERN = re.compile(r'(?<=[。！？!?])')
+
+
+def _cap_length(piece: str, max_chars: int) -> List[str]:
+    """超长片段优先在换行处切开，其次在空白处，最后按长度硬切"""
+    parts = []
+    while len(piece) > max_chars:
+        cut = piece.rfind("\n", 0, max_chars)
+        if cut <= 0:
+            cut = max(piece.rfind(" ", 0, max_chars), piece.rfind("\u3000", 0, max_chars))
+        if cut <= 0:
+            cut = max_chars
+        parts.append(piece[:cut])
+        piece = piece[cut:]
+    parts.append(piece)
+    return parts
+
+
+def split_into_parse_blocks(text: str, max_chars: int = 2000) -> List[str]:
+    """
+    把原始文本（尚未 clean_text）切成供 nlp.pipe 分批解析的文本块，每块再分别清洗。
+    clean_text 会删除“。！？”并把换行合并为空格，因此必须先在句末标点处切分再清洗；
+    超过 max_chars 的句子在换行或空白处继续切开，保证每块都不超过 max_chars。
+    """
+    blocks = []
+    for piece in _SENTENCE_END_PATTERN.split(text or ""):
+        for part in _cap_length(piece, max_chars):
+            cleaned = clean_text(part)
+            if cleaned:
+                blocks.append(cleaned)
+    return blocks
+
+
 def segment_sentences(text: str) -> List[str]:
     """使用SpaCy进行分句"""
     nlp_model = load_spacy_model()
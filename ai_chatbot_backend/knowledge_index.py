@@ -0,0 +1,256 @@
+# knowledge_index.py
+# 知识片段检索：知识条目在 process_knowledge_entry 时切分为片段并写入 knowledge_chunks 表，
+# 进程内维护一份基于中文字符 bigram 的 BM25 倒排索引，/chat 只注入与问题最相关的 top-k 片段。
+# 多个 worker 的 BM25 索引和共享向量文件都从 knowledge_chunks 表构建，保证各进程看到的片段一致。
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy.orm import Session as DBSession
+
+from database import KnowledgeEntry, KnowledgeChunk, SessionLocal
+from vector_store import get_vector_store
+
+CHUNK_MAX_CHARS = 300
+BM25_K1 = 1.5
+BM25_B = 0.75
+# 混合检索中关键词分数的权重，其余权重给向量余弦相似度
+HYBRID_KEYWORD_WEIGHT = 0.5
+
+_SENTENCE_SPLIT_PATTERN = re.compile(r'(?<=[。！？；!?;\n])')
+_TOKEN_PATTERN = re.compile(r'[一-龥]+|[a-zA-Z]+|\d+')
+
+
+def split_into_chunks(text: str, max_chars: int = CHUNK_MAX_CHARS) -> List[str]:
+    """按句子边界把文本打包成不超过 max_chars 的片段，超长的单句再按长度硬切分"""
+    chunks: List[str] = []
+    current = ""
+    for sentence in _SENTENCE_SPLIT_PATTERN.split(text or ""):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        while len(sentence) > max_chars:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(sentence[:max_chars])
+            sentence = sentence[max_chars:]
+        if current and len(current) + len(sentence) + 1 > max_chars:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n{sentence}" if current else sentence
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def tokenize(text: str) -> List[str]:
+    """中文按字符 bigram 切分（单字词保留单字），英文单词转小写，数字整体保留"""
+    tokens: List[str] = []
+    for run in _TOKEN_PATTERN.findall(text or ""):
+        if '一' <= run[0] <= '龥':
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run.lower())
+    return tokens
+
+
+class BM25Index:
+    """不可变的 BM25 倒排索引；知识变化时整体重建后原子替换"""
+
+    def __init__(self, chunks: List[Dict]):
+        self.chunks = chunks
+        self.postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        self.doc_lengths: List[int] = []
+        for doc_idx, chunk in enumerate(chunks):
+            term_counts = Counter(tokenize(chunk["content"]))
+            self.doc_lengths.append(sum(term_counts.values()))
+            for term, tf in term_counts.items():
+                self.postings[term][doc_idx] = tf
+        self.avg_doc_length = (sum(self.doc_lengths) / len(self.doc_lengths)) if self.doc_lengths else 0.0
+        self.chunks_by_entry: Dict[int, List[Dict]] = defaultdict(list)
+        self.chunk_by_key: Dict[tuple, Dict] = {}
+        for chunk in chunks:
+            self.chunks_by_entry[chunk["knowledge_id"]].append(chunk)
+            self.chunk_by_key[(chunk["knowledge_id"], chunk["chunk_index"])] = chunk
+
+    def has_entry(self, knowledge_id: int) -> bool:
+        return knowledge_id in self.chunks_by_entry
+
+    def chunks_of(self, knowledge_id: int) -> List[Dict]:
+        return list(self.chunks_by_entry.get(knowledge_id, []))
+
+    def search(self, query: str, top_k: int = 5, types: Optional[Iterable[str]] = None,
+               knowledge_ids: Optional[Iterable[int]] = None) -> List[Dict]:
+        """返回得分最高的 top_k 个片段（附带 score），可按知识类型或条目 id 过滤"""
+        if not self.chunks:
+            return []
+        allowed_types = set(types) if types is not None else None
+        allowed_ids = set(knowledge_ids) if knowledge_ids is not None else None
+        total_docs = len(self.chunks)
+
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            term_postings = self.postings.get(term)
+            if not term_postings:
+                continue
+            idf = math.log(1 + (total_docs - len(term_postings) + 0.5) / (len(term_postings) + 0.5))
+            for doc_idx, tf in term_postings.items():
+                chunk = self.chunks[doc_idx]
+                if allowed_types is not None and chunk["type"] not in allowed_types:
+                    continue
+                if allowed_ids is not None and chunk["knowledge_id"] not in allowed_ids:
+                    continue
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[doc_idx] / self.avg_doc_length)
+                scores[doc_idx] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:top_k]
+        return [dict(self.chunks[doc_idx], score=round(score, 4)) for doc_idx, score in ranked]
+
+
+_index = BM25Index([])
+_index_lock = threading.Lock()
+# 构建 _index 时向量索引的指纹；其他 worker 发布新版本向量文件后两者不一致，本进程据此从数据库重新加载
+_index_vector_fingerprint: Optional[str] = None
+
+
+def get_knowledge_index() -> BM25Index:
+    _sync_with_vector_store()
+    return _index
+
+
+def _load_chunk_records(db: DBSession) -> List[Dict]:
+    """knowledge_chunks 表是所有 worker 共享的唯一数据来源，只取已处理且未删除的条目"""
+    rows = db.query(KnowledgeChunk, KnowledgeEntry).join(
+        KnowledgeEntry, KnowledgeChunk.knowledge_id == KnowledgeEntry.id
+    ).filter(
+        KnowledgeEntry.status == 'processed',
+        KnowledgeEntry.is_deleted == False
+    ).order_by(KnowledgeChunk.knowledge_id, KnowledgeChunk.chunk_index).all()
+    return [{
+        "chunk_id": chunk.id,
+        "knowledge_id": entry.id,
+        "chunk_index": chunk.chunk_index,
+        "title": entry.title,
+        "type": entry.type,
+        "content": chunk.content,
+    } for chunk, entry in rows]
+
+
+def refresh_knowledge_index():
+    """
+    从数据库重建本进程的 BM25 索引，并增量重建共享的向量文件（只对新增或内容变化的片段计算向量）。
+    在一批条目处理完成（或删除、等待重新处理）并提交之后调用一次。
+    """
+    global _index, _index_vector_fingerprint
+    db = SessionLocal()
+    try:
+        with _index_lock:
+            records = _load_chunk_records(db)
+            _index = BM25Index(records)
+            store = get_vector_store()
+            try:
+                store.rebuild(records)
+            except Exception as e:
+                print(f"重建向量索引时发生错误（仅使用关键词检索）: {e}")
+            _index_vector_fingerprint = store.fingerprint
+    finally:
+        db.close()
+
+
+def _sync_with_vector_store():
+    """其他 worker 发布了新版本向量文件时，只从数据库重新加载关键词索引，不改写向量文件"""
+    global _index, _index_vector_fingerprint
+    store = get_vector_store()
+    store.reload_if_changed()
+    fingerprint = store.fingerprint
+    if fingerprint is None or fingerprint == _index_vector_fingerprint:
+        return
+    db = SessionLocal()
+    try:
+        with _index_lock:
+            if fingerprint == _index_vector_fingerprint:
+                return
+            _index = BM25Index(_load_chunk_records(db))
+            _index_vector_fingerprint = fingerprint
+    except Exception as e:
+        print(f"重新加载知识片段索引时发生错误: {e}")
+    finally:
+        db.close()
+
+
+def search_knowledge(query: str, top_k: int = 5, types: Optional[Iterable[str]] = None,
+                     knowledge_ids: Optional[Iterable[int]] = None) -> List[Dict]:
+    """
+    混合检索：BM25 分数按本次最高分归一化，与向量余弦相似度加权融合。
+    用户换了说法、关键词对不上时，仍能通过向量检索找到相应的片段。
+    """
+    index = get_knowledge_index()
+    candidate_k = top_k * 3
+    keyword_hits = index.search(query, candidate_k, types, knowledge_ids)
+    dense_hits = get_vector_store().search(query, candidate_k, types, knowledge_ids)
+    if not dense_hits:
+        return keyword_hits[:top_k]
+
+    fused: Dict[tuple, Dict] = {}
+    max_keyword_score = max((hit["score"] for hit in keyword_hits), default=0.0) or 1.0
+    for hit in keyword_hits:
+        key = (hit["knowledge_id"], hit["chunk_index"])
+        fused[key] = {"chunk": hit, "score": HYBRID_KEYWORD_WEIGHT * hit["score"] / max_keyword_score}
+    for key, similarity in dense_hits:
+        chunk = index.chunk_by_key.get(key)
+        if chunk is None:
+            # 向量文件刚被重建而本进程尚未重新加载，两者暂不一致
+            continue
+        fused.setdefault(key, {"chunk": chunk, "score": 0.0})["score"] += (1 - HYBRID_KEYWORD_WEIGHT) * similarity
+
+    ranked = sorted(fused.values(),
+                    key=lambda item: (-item["score"], item["chunk"]["knowledge_id"], item["chunk"]["chunk_index"]))
+    return [dict(item["chunk"], score=round(item["score"], 4)) for item in ranked[:top_k]]
+
+
+def index_knowledge_entry(db: DBSession, entry: KnowledgeEntry) -> int:
+    """
+    切分知识条目内容，替换其在 knowledge_chunks 表中的片段，返回片段数。
+    检索索引不在这里更新：调用方提交事务后再调用一次 refresh_knowledge_index。
+    """
+    contents = split_into_chunks(entry.content)
+    db.query(KnowledgeChunk).filter(KnowledgeChunk.knowledge_id == entry.id).delete(synchronize_session=False)
+    db.add_all([KnowledgeChunk(knowledge_id=entry.id, chunk_index=i, content=content)
+                for i, content in enumerate(contents)])
+    db.flush()
+    return len(contents)
+
+
+def rebuild_knowledge_index_from_db():
+    """启动时从数据库加载所有已处理条目的片段；尚未切分过的条目在此补切分"""
+    db = SessionLocal()
+    try:
+        chunked_ids = {knowledge_id for (knowledge_id,) in db.query(KnowledgeChunk.knowledge_id).distinct()}
+        entries = db.query(KnowledgeEntry).filter(
+            KnowledgeEntry.status == 'processed',
+            KnowledgeEntry.is_deleted == False
+        ).all()
+        backfilled = 0
+        for entry in entries:
+            if entry.id not in chunked_ids and entry.content:
+                index_knowledge_entry(db, entry)
+                backfilled += 1
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"补切分知识条目时发生错误: {e}")
+        return
+    finally:
+        db.close()
+
+    try:
+        refresh_knowledge_index()
+        print(f"知识片段索引已加载：{len(_index.chunks_by_entry)} 个条目，{len(_index.chunks)} 个片段（补切分 {backfilled} 个条目）。")
+    except Exception as e:
+        print(f"加载知识片段索引时发生错误: {e}")
@@ -0,0 +1,113 @@
+# knowledge_snapshot.py
+# 已处理知识条目的进程内只读快照：启动时从 MySQL 加载一次，按类型和标题关键词预先建立查找表，
+# 条目处理完成、编辑或删除时整体替换快照，/chat 热路径上不再查询 knowledge_entries 表。
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+from database import KnowledgeEntry, SessionLocal
+
+# 快照最长使用时间；超过后在后台重新加载，以同步其他 worker 进程对知识库的修改
+KNOWLEDGE_SNAPSHOT_MAX_AGE_SECONDS = int(os.getenv("KNOWLEDGE_SNAPSHOT_MAX_AGE_SECONDS", "300"))
+
+
+class KnowledgeSnapshot:
+    """不可变快照，创建后不再修改；更新时构造新对象后替换"""
+
+    def __init__(self, entries: Dict[int, Dict], title_keywords: Iterable[str] = ()):
+        self.entries = entries
+        self.created_at = time.monotonic()
+        self.title_keywords = list(title_keywords)
+        self.by_type: Dict[str, List[Dict]] = {}
+        for knowledge_id in sorted(entries):
+            entry = entries[knowledge_id]
+            self.by_type.setdefault(entry["type"], []).append(entry)
+        # (类型, 标题关键词) -> 标题包含该关键词的第一个条目（按 id 排序）
+        self.by_title_keyword: Dict[tuple, Dict] = {}
+        for entry_type, typed_entries in self.by_type.items():
+            for keyword in self.title_keywords:
+                for entry in typed_entries:
+                    if keyword in entry["title"]:
+                        self.by_title_keyword[(entry_type, keyword)] = entry
+                        break
+
+    def find_by_title_keyword(self, entry_type: str, keyword: str) -> Optional[Dict]:
+        entry = self.by_title_keyword.get((entry_type, keyword))
+        if entry is None and keyword not in self.title_keywords:
+            # 未预先建立查找表的关键词，退化为顺序查找
+            entry = next((e for e in self.by_type.get(entry_type, []) if keyword in e["title"]), None)
+        return entry
+
+    def of_type(self, entry_type: str) -> List[Dict]:
+        return list(self.by_type.get(entry_type, []))
+
+
+def _entry_record(entry: KnowledgeEntry) -> Dict:
+    return {"id": entry.id, "title": entry.title, "type": entry.type, "content": entry.content}
+
+
+def _is_servable(entry: KnowledgeEntry) -> bool:
+    return entry.status == 'processed' and not entry.is_deleted
+
+
+_snapshot = KnowledgeSnapshot({})
+_snapshot_lock = threading.Lock()
+_title_keywords: List[str] = []
+_background_refresh_running = False
+
+
+def refresh_knowledge_snapshot(title_keywords: Optional[Iterable[str]] = None) -> KnowledgeSnapshot:
+    """从数据库重新加载全部已处理条目并替换快照；title_keywords 为需要预建查找表的标题关键词"""
+    global _snapshot, _title_keywords
+    db = SessionLocal()
+    try:
+        entries = db.query(KnowledgeEntry).filter(
+            KnowledgeEntry.status == 'processed',
+            KnowledgeEntry.is_deleted == False
+        ).all()
+        records = {entry.id: _entry_record(entry) for entry in entries}
+    finally:
+        db.close()
+
+    with _snapshot_lock:
+        if title_keywords is not None:
+            _title_keywords = list(title_keywords)
+        _snapshot = KnowledgeSnapshot(records, _title_keywords)
+    print(f"知识快照已加载：{len(records)} 个已处理条目。")
+    return _snapshot
+
+
+def update_snapshot_entry(entry: KnowledgeEntry):
+    """条目处理完成、被编辑或被删除后调用：只替换该条目，其余条目沿用旧快照中的数据"""
+    global _snapshot
+    with _snapshot_lock:
+        entries = dict(_snapshot.entries)
+        if _is_servable(entry):
+            entries[entry.id] = _entry_record(entry)
+        else:
+            entries.pop(entry.id, None)
+        _snapshot = KnowledgeSnapshot(entries, _title_keywords)
+
+
+def _refresh_in_background():
+    global _background_refresh_running
+    try:
+        refresh_knowledge_snapshot()
+    except Exception as e:
+        print(f"后台刷新知识快照时发生错误: {e}")
+    finally:
+        _background_refresh_running = False
+
+
+def get_knowledge_snapshot() -> KnowledgeSnapshot:
+    """返回当前快照；快照过期时在后台线程中刷新，本次调用仍返回旧快照，不阻塞请求"""
+    global _background_refresh_running
+    snapshot = _snapshot
+    if time.monotonic() - snapshot.created_at > KNOWLEDGE_SNAPSHOT_MAX_AGE_SECONDS:
+        with _snapshot_lock:
+            start_refresh = not _background_refresh_running
+            _background_refresh_running = True
+        if start_refresh:
+            threading.Thread(target=_refresh_in_background, name="knowledge-snapshot-refresh", daemon=True).start()
+    return snapshot
@@ -0,0 +1,44 @@
+# llm_pool.py
+# Spark 客户端池：ChatSparkLLM 的结果队列挂在实例上，同一个实例被多个线程同时调用时回答会串台，
+# 因此并发执行时每个调用都要独占一个客户端实例。
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+
+class LLMClientPool:
+    """固定大小的 LLM 客户端池，调用方通过 acquire() 独占一个实例"""
+
+    def __init__(self, factory: Callable[[], Any], size: int):
+        self._factory = factory
+        self.size = size
+        self._clients: "queue.Queue[Any]" = queue.Queue()
+        for _ in range(size):
+            self._clients.put(factory())
+        self._lock = threading.Lock()
+        self._stats = {"acquired": 0, "replaced": 0}
+
+    @contextmanager
+    def acquire(self, timeout: Optional[float] = None) -> Iterator[Any]:
+        client = self._clients.get(timeout=timeout)
+        with self._lock:
+            self._stats["acquired"] += 1
+        healthy = False
+        try:
+            yield client
+            healthy = True
+        finally:
+            if not healthy:
+                # 调用中途出错时，实例内部队列里可能残留上一次请求的帧，换一个新实例放回池中
+                with self._lock:
+                    self._stats["replaced"] += 1
+                client = self._factory()
+            self._clients.put(client)
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["size"] = self.size
+        stats["idle"] = self._clients.qsize()
+        return stats
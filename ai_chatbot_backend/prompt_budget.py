@@ -0,0 +1,186 @@
+# prompt_budget.py
+# Prompt 的 token 预算：按优先级在系统提示词、图谱数据、检索片段和会话历史之间分配固定预算，
+# 超出时按固定规则裁剪，保证 Prompt 长度（以及回答延迟）有上界，不会超出星火的上下文长度限制。
+import hashlib
+import math
+import os
+import re
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+# 发送给星火的 Prompt 上限（系统提示词 + 历史消息），需为回答预留足够的上下文
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "6000"))
+# 每条消息的角色、分隔符等额外开销
+MESSAGE_TOKEN_OVERHEAD = 4
+# 剩余预算不足该值时，不再放入被截断的片段，避免注入只剩半句话的内容
+MIN_PARTIAL_CHUNK_TOKENS = 80
+
+_CJK_PATTERN = re.compile(r'[　-〿一-鿿＀-￯]')
+_WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    估算文本的 token 数：中文字符和全角标点按每字 1 个 token 计（偏保守），
+    其余非空白字符按每 4 个字符 1 个 token 计。
+    """
+    if not text:
+        return 0
+    cjk_count = len(_CJK_PATTERN.findall(text))
+    other_count = len(_WHITESPACE_PATTERN.sub("", text)) - cjk_count
+    return cjk_count + math.ceil(max(other_count, 0) / 4)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """按行截断文本，使其不超过 max_tokens；首行本身超长时按字符截断"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    kept: List[str] = []
+    used = 0
+    for line in text.split("\n"):
+        line_tokens = estimate_tokens(line) + 1
+        if used + line_tokens > max_tokens:
+            if not kept or not "".join(kept).strip():
+                # 第一行就超出预算，逐字截断
+                kept.append(line[:max(max_tokens - used, 0)])
+            break
+        kept.append(line)
+        used += line_tokens
+    return "\n".join(kept)
+
+
+class PromptBudgetManager:
+    """
+    按优先级分配 Prompt 预算：
+    1. 系统提示词和意图提示（必须保留）
+    2. 用户当前的问题（历史中的最后一条，必须保留）
+    3. 早期对话摘要
+    4. 图谱精确数据
+    5. 检索到的知识片段（按检索排名依次放入，去重后超出预算的部分截断或丢弃）
+    6. 窗口内的会话历史（从最近一轮往前放入，放不下的最早几轮被丢弃）
+    """
+
+    def __init__(self, budget: int = PROMPT_TOKEN_BUDGET):
+        self.budget = budget
+        self._lock = threading.Lock()
+        self._stats = {
+            "requests": 0,
+            "total_prompt_tokens": 0,
+            "max_prompt_tokens": 0,
+            "last_prompt_tokens": 0,
+            "trimmed_requests": 0,
+            "dropped_chunks": 0,
+            "duplicate_chunks": 0,
+            "dropped_history_messages": 0,
+        }
+
+    @staticmethod
+    def _dedupe_chunks(knowledge_chunks: List[str]) -> Tuple[List[str], int]:
+        """
+        整段去重：同一片段可能同时作为政策文档和通用知识被注入（说明行不同、正文相同），
+        按去掉空白后的正文哈希只保留第一次出现的那段。片段内部的重复行（如表格中相同的行）原样保留。
+        """
+        seen = set()
+        deduped: List[str] = []
+        duplicate_chunks = 0
+        for chunk in knowledge_chunks:
+            lines = chunk.strip("\n").split("\n")
+            header, body = lines[0], lines[1:]
+            normalized = _WHITESPACE_PATTERN.sub("", "".join(body))
+            if not normalized:
+                continue
+            key = hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+            if key in seen:
+                duplicate_chunks += 1
+                continue
+            seen.add(key)
+            deduped.append("\n\n" + "\n".join([header] + body))
+        return deduped, duplicate_chunks
+
+    def allocate(self, base_prompt: str, instruction: str, graph_context: str,
+                 knowledge_chunks: List[str], history: List[Any], history_summary: str = "") -> Dict[str, Any]:
+        """
+        在预算内挑选各部分内容。history 中的元素需带有 content 属性，最后一条为用户当前问题。
+        返回裁剪后的 history_summary、graph_context、knowledge_chunks、history 以及最终的 prompt_tokens。
+        """
+        remaining = self.budget
+        remaining -= estimate_tokens(base_prompt) + estimate_tokens(instruction) + MESSAGE_TOKEN_OVERHEAD
+
+        current_message = history[-1:] if history else []
+        earlier_history = history[:-1]
+        for message in current_message:
+            remaining -= estimate_tokens(message.content) + MESSAGE_TOKEN_OVERHEAD
+
+        trimmed = False
+        if history_summary:
+            summary_tokens = estimate_tokens(history_summary)
+            if summary_tokens > remaining:
+                history_summary = truncate_to_tokens(history_summary, max(remaining, 0))
+                summary_tokens = estimate_tokens(history_summary)
+                trimmed = True
+            remaining -= summary_tokens
+
+        if graph_context:
+            graph_tokens = estimate_tokens(graph_context)
+            if graph_tokens > remaining:
+                graph_context = truncate_to_tokens(graph_context, max(remaining, 0))
+                graph_tokens = estimate_tokens(graph_context)
+                trimmed = True
+            remaining -= graph_tokens
+
+        deduped_chunks, duplicate_chunks = self._dedupe_chunks(knowledge_chunks)
+        kept_chunks: List[str] = []
+        dropped_chunks = 0
+        for chunk in deduped_chunks:
+            chunk_tokens = estimate_tokens(chunk)
+            if chunk_tokens <= remaining:
+                kept_chunks.append(chunk)
+                remaining -= chunk_tokens
+                continue
+            trimmed = True
+            partial = truncate_to_tokens(chunk, remaining) if remaining >= MIN_PARTIAL_CHUNK_TOKENS else ""
+            if "\n" in partial.strip("\n"):
+                kept_chunks.append(partial)
+                remaining -= estimate_tokens(partial)
+            else:
+                # 连说明行之后的第一行都放不下，整段丢弃
+                dropped_chunks += 1
+
+        kept_history: List[Any] = []
+        for message in reversed(earlier_history):
+            message_tokens = estimate_tokens(message.content) + MESSAGE_TOKEN_OVERHEAD
+            if message_tokens > remaining:
+                break
+            kept_history.append(message)
+            remaining -= message_tokens
+        kept_history.reverse()
+        dropped_history = len(earlier_history) - len(kept_history)
+        if dropped_history:
+            trimmed = True
+
+        prompt_tokens = self.budget - remaining
+        with self._lock:
+            self._stats["requests"] += 1
+            self._stats["total_prompt_tokens"] += prompt_tokens
+            self._stats["max_prompt_tokens"] = max(self._stats["max_prompt_tokens"], prompt_tokens)
+            self._stats["last_prompt_tokens"] = prompt_tokens
+            self._stats["trimmed_requests"] += 1 if trimmed else 0
+            self._stats["dropped_chunks"] += dropped_chunks
+            self._stats["duplicate_chunks"] += duplicate_chunks
+            self._stats["dropped_history_messages"] += dropped_history
+
+        return {
+            "history_summary": history_summary,
+            "graph_context": graph_context,
+            "knowledge_chunks": kept_chunks,
+            "history": kept_history + current_message,
+            "prompt_tokens": prompt_tokens,
+        }
+
+    def get_stats(self) -> Dict[str, Optional[float]]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["budget"] = self.budget
+        stats["avg_prompt_tokens"] = (round(stats["total_prompt_tokens"] / stats["requests"], 1)
+                                      if stats["requests"] else None)
+        return stats
@@ -0,0 +1,316 @@
+# score_lines.py
+# 录取分数线的结构化存储：处理“录取分数”文档时逐行解析出 年份/省份/招生类型/科目组/专业/分数，
+# 写入 score_lines 表并在内存中建立索引。分数类问题只注入与问题匹配的几行记录，
+# 不再把整份录取分数文档（或其片段）塞进提示词。
+import os
+import re
+import threading
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.orm import Session as DBSession
+
+from database import KnowledgeEntry, ScoreLine, SessionLocal
+from knowledge_extractor.aho_corasick import AhoCorasickAutomaton
+
+# 标题包含该关键词的知识条目按录取分数文档解析
+SCORE_DOCUMENT_TITLE_KEYWORD = "录取分数"
+DEFAULT_ADMISSION_TYPE = "普通类"
+DEFAULT_PROVINCE = "福建省"
+# 未指定专业时（如“物理类最低多少分”）最多注入的记录数
+SCORE_LINE_MAX_ROWS = int(os.getenv("SCORE_LINE_MAX_ROWS", "30"))
+
+ADMISSION_TYPES = ["普通类", "体育类", "艺术类"]
+SUBJECT_GROUP_KEYWORDS = {"物理": "物理组", "历史": "历史组"}
+
+_HEADER_PATTERN = re.compile(r'(20\d{2})\s*年\s*在?\s*([一-龥]{2,8}?省)')
+_YEAR_PATTERN = re.compile(r'(?<!\d)(20\d{2})(?!\d)')
+_SECTION_PATTERN = re.compile(r'^【(.+?)】$')
+# 段落形式：“1.  汉语言文学：最高分 529，最低分 504，省排名 71643”、“普通专业：最高分 529，最低分 489”
+_SCORE_LINE_PATTERN = re.compile(r'^(?:(?P<number>\d+)\s*[.、．]\s*)?(?P<name>[^：:]+?)\s*[：:]\s*(?P<body>.*最低分.*)$')
+_SCORE_FIELD_PATTERNS = {
+    "max_score": re.compile(r'最高分\s*(\d+)'),
+    "min_score": re.compile(r'最低分\s*(\d+)'),
+    "avg_score": re.compile(r'平均分\s*(\d+)'),
+    "province_rank": re.compile(r'(?:省排名|位次)\s*(\d+)'),
+}
+# 问题中“xx专业”的 xx（可能带前缀，如“2024年计算机”），用于识别表中没有完整名称的专业
+_ASKED_MAJOR_PATTERN = re.compile(r'([一-龥A-Za-z]{2,20}?)专业')
+# 以这些词结尾的“xx专业”是泛指（“哪些专业”“各专业”），不是在问某个具体专业
+_GENERIC_MAJOR_WORDS = ("什么", "哪些", "哪个", "所有", "全部", "每个", "其他", "各")
+_NAME_NOTE_PATTERN = re.compile(r'^(?P<name>.+?)\s*[（(](?P<note>[^）)]+)[）)]$')
+# 表格形式（extract_text_from_docx 把表格行按空格拼接）：表头单元格 -> 字段
+_TABLE_HEADER_FIELDS = {
+    "年份": "year", "省份": "province", "招生类型": "admission_type", "类别": "admission_type",
+    "科类": "subject_group", "科目组": "subject_group", "选考科目": "subject_group", "专业": "major",
+    "最高分": "max_score", "最低分": "min_score", "平均分": "avg_score", "位次": "province_rank",
+    "省排名": "province_rank",
+}
+_INT_FIELDS = ("year", "max_score", "min_score", "avg_score", "province_rank")
+
+
+def is_score_document(title: Optional[str]) -> bool:
+    return bool(title) and SCORE_DOCUMENT_TITLE_KEYWORD in title
+
+
+def _subject_group_of(text: str) -> Optional[str]:
+    for keyword, group in SUBJECT_GROUP_KEYWORDS.items():
+        if keyword in text:
+            return group
+    return None
+
+
+def _admission_type_of(text: str) -> Optional[str]:
+    return next((t for t in ADMISSION_TYPES if t[:2] in text), None)
+
+
+def _split_major_name(name: str):
+    """“学前教育(师范)” -> (“学前教育”, “师范”)"""
+    match = _NAME_NOTE_PATTERN.match(name)
+    if match:
+        return match.group("name").strip(), match.group("note").strip()
+    return name.strip(), None
+
+
+def parse_score_lines(text: str, default_year: Optional[int] = None,
+                      default_province: str = DEFAULT_PROVINCE) -> List[Dict[str, Any]]:
+    """
+    逐行解析录取分数文档（需保留原始换行，不能先经过 clean_text）。
+    年份、省份取自文档中第一处“XXXX年在XX省”；【物理类】【历史类】等分节标题决定后续行的科目组和招生类型。
+    未编号的行为整体分数线（普通专业、国际课程），编号行为各专业分数线。
+    """
+    year, province = default_year, default_province
+    header = _HEADER_PATTERN.search(text or "")
+    if header:
+        year, province = int(header.group(1)), header.group(2)
+    if year is None:
+        return []
+
+    context = {"subject_group": None, "admission_type": DEFAULT_ADMISSION_TYPE}
+    table_columns: Optional[List[Optional[str]]] = None
+    records: List[Dict[str, Any]] = []
+    for raw_line in (text or "").splitlines():
+        line = raw_line.strip()
+        if not line:
+            continue
+
+        section = _SECTION_PATTERN.match(line)
+        if section:
+            context = {"subject_group": _subject_group_of(section.group(1)) or context["subject_group"],
+                       "admission_type": _admission_type_of(section.group(1)) or DEFAULT_ADMISSION_TYPE}
+            continue
+
+        match = _SCORE_LINE_PATTERN.match(line)
+        if match:
+            major, note = _split_major_name(match.group("name"))
+            record = {"year": year, "province": province, "admission_type": context["admission_type"],
+                      "subject_group": context["subject_group"], "major": major, "note": note,
+                      "is_overall": match.group("number") is None}
+            for field, pattern in _SCORE_FIELD_PATTERNS.items():
+                field_match = pattern.search(match.group("body"))
+                record[field] = int(field_match.group(1)) if field_match else None
+            records.append(record)
+            continue
+
+        cells = line.split()
+        if "专业" in cells and ("最低分" in cells or "平均分" in cells):
+            table_columns = [_TABLE_HEADER_FIELDS.get(cell) for cell in cells]
+            continue
+        if table_columns and len(cells) == len(table_columns):
+            record = {"year": year, "province": province, "admission_type": context["admission_type"],
+                      "subject_group": context["subject_group"], "note": None, "is_overall": False,
+                      "max_score": None, "min_score": None, "avg_score": None, "province_rank": None}
+            for field, cell in zip(table_columns, cells):
+                if field is None:
+                    continue
+                if field in _INT_FIELDS:
+                    record[field] = int(cell) if cell.isdigit() else None
+                elif field == "subject_group":
+                    record[field] = _subject_group_of(cell) or cell
+                elif field == "admission_type":
+                    record[field] = _admission_type_of(cell) or cell
+                else:
+                    record[field] = cell
+            if record.get("major") and record["year"] is not None:
+                record["major"], record["note"] = _split_major_name(record["major"])
+                records.append(record)
+    return records
+
+
+class ScoreLineIndex:
+    """不可变的分数线索引，更新时构造新对象后替换"""
+
+    def __init__(self, records_by_entry: Dict[int, List[Dict[str, Any]]]):
+        self.records_by_entry = records_by_entry
+        self.records = [record for knowledge_id in sorted(records_by_entry)
+                        for record in records_by_entry[knowledge_id]]
+        self.by_major: Dict[str, List[Dict[str, Any]]] = {}
+        for record in self.records:
+            if not record["is_overall"]:
+                self.by_major.setdefault(record["major"], []).append(record)
+        self.years = sorted({record["year"] for record in self.records}, reverse=True)
+        self._automaton = AhoCorasickAutomaton()
+        for major in self.by_major:
+            self._automaton.add(major)
+        self._automaton.build()
+
+    def majors_in(self, question: str) -> List[str]:
+        return list(dict.fromkeys(major for _, _, major in self._automaton.find_longest(question)))
+
+    def majors_matching(self, name: str) -> List[str]:
+        """
+        名称不完整时的匹配：取 name 最长的、是某个专业名称开头的后缀（“2024年计算机” -> “计算机”），
+        返回以它开头的所有专业；name 本身包含某个专业名称时也算匹配。都不匹配时返回空列表。
+        只按开头匹配，避免“土木工程”因为“工程”匹配到“软件工程”。
+        """
+        contained = [major for major in self.by_major if major in name]
+        if contained:
+            return contained
+        for start in range(len(name) - 1):
+            suffix = name[start:]
+            matched = [major for major in self.by_major if major.startswith(suffix)]
+            if matched:
+                return matched
+        return []
+
+    def query(self, majors: Optional[List[str]] = None, subject_group: Optional[str] = None,
+              year: Optional[int] = None, admission_type: Optional[str] = None,
+              include_overall: bool = True) -> List[Dict[str, Any]]:
+        """按条件过滤记录；指定专业时同时返回对应科目组的整体分数线，便于比较"""
+        if majors:
+            candidates = [record for major in majors for record in self.by_major.get(major, [])]
+        else:
+            candidates = [record for record in self.records if not record["is_overall"]]
+        rows = [record for record in candidates
+                if (subject_group is None or record["subject_group"] == subject_group)
+                and (year is None or record["year"] == year)
+                and (admission_type is None or record["admission_type"] == admission_type)]
+        if include_overall and rows:
+            groups = {(record["year"], record["admission_type"], record["subject_group"]) for record in rows}
+            overall = [record for record in self.records if record["is_overall"]
+                       and (record["year"], record["admission_type"], record["subject_group"]) in groups]
+            rows = overall + rows
+        return rows
+
+
+_score_index = ScoreLineIndex({})
+_score_index_lock = threading.Lock()
+_lookup_stats = {"lookups": 0, "answered": 0, "fallbacks": 0, "rows_injected": 0}
+
+
+def _row_record(row: ScoreLine) -> Dict[str, Any]:
+    return {field: getattr(row, field) for field in (
+        "year", "province", "admission_type", "subject_group", "major", "note", "is_overall",
+        "max_score", "min_score", "avg_score", "province_rank")}
+
+
+def _replace_entry_records(knowledge_id: int, records: Optional[List[Dict[str, Any]]]):
+    global _score_index
+    with _score_index_lock:
+        records_by_entry = dict(_score_index.records_by_entry)
+        if records:
+            records_by_entry[knowledge_id] = records
+        else:
+            records_by_entry.pop(knowledge_id, None)
+        _score_index = ScoreLineIndex(records_by_entry)
+
+
+def index_score_lines(db: DBSession, entry: KnowledgeEntry) -> int:
+    """
+    解析录取分数文档并替换该条目在 score_lines 表和内存索引中的记录，返回记录数。
+    非录取分数文档返回 0（并清除该条目改名前可能留下的旧记录）。
+    """
+    records = parse_score_lines(entry.content) if is_score_document(entry.title) else []
+    db.query(ScoreLine).filter(ScoreLine.knowledge_id == entry.id).delete(synchronize_session=False)
+    db.add_all(ScoreLine(knowledge_id=entry.id, **record) for record in records)
+    db.flush()
+    _replace_entry_records(entry.id, records)
+    return len(records)
+
+
+def remove_score_lines(knowledge_id: int):
+    """条目被删除或等待重新处理时，从内存索引中移除其记录"""
+    _replace_entry_records(knowledge_id, None)
+
+
+def rebuild_score_index_from_db():
+    """启动时从数据库加载所有已处理录取分数文档的记录"""
+    global _score_index
+    db = SessionLocal()
+    try:
+        rows = db.query(ScoreLine).join(KnowledgeEntry, KnowledgeEntry.id == ScoreLine.knowledge_id).filter(
+            KnowledgeEntry.status == 'processed',
+            KnowledgeEntry.is_deleted == False
+        ).order_by(ScoreLine.id).all()
+        records_by_entry: Dict[int, List[Dict[str, Any]]] = {}
+        for row in rows:
+            records_by_entry.setdefault(row.knowledge_id, []).append(_row_record(row))
+    finally:
+        db.close()
+
+    with _score_index_lock:
+        _score_index = ScoreLineIndex(records_by_entry)
+    print(f"录取分数线索引已加载：{len(rows)} 条记录。")
+
+
+def query_score_lines(majors: Optional[List[str]] = None, subject_group: Optional[str] = None,
+                      year: Optional[int] = None, admission_type: Optional[str] = None) -> List[Dict[str, Any]]:
+    return _score_index.query(majors, subject_group, year, admission_type)
+
+
+def lookup_score_lines(question: str, identified_major: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
+    """
+    从问题中识别专业、科目组（物理/历史）、年份、招生类型后查询分数线。
+    问到了某个专业（意图识别出专业，或问题中有“xx专业”）但在分数线表中找不到对应专业时，
+    不返回全部记录；索引为空或没有匹配记录时同样返回 None，由调用方回退为检索录取分数文档片段。
+    """
+    index = _score_index
+    majors = index.majors_in(question)
+    if not majors:
+        asked_names = [identified_major] if identified_major else []
+        asked_names.extend(name for name in _ASKED_MAJOR_PATTERN.findall(question)
+                           if not name.endswith(_GENERIC_MAJOR_WORDS))
+        for name in asked_names:
+            majors.extend(major for major in index.majors_matching(name) if major not in majors)
+        if asked_names and not majors:
+            majors = None
+    rows = []
+    if majors is not None:
+        years = [int(year) for year in _YEAR_PATTERN.findall(question)]
+        year = years[0] if years else (index.years[0] if index.years else None)
+        rows = index.query(majors, _subject_group_of(question), year, _admission_type_of(question))
+        rows = rows[:SCORE_LINE_MAX_ROWS]
+    with _score_index_lock:
+        _lookup_stats["lookups"] += 1
+        if rows:
+            _lookup_stats["answered"] += 1
+            _lookup_stats["rows_injected"] += len(rows)
+        else:
+            _lookup_stats["fallbacks"] += 1
+    return rows or None
+
+
+def format_score_lines(rows: List[Dict[str, Any]]) -> str:
+    """每条记录一行，例如“2024年 福建省 普通类 物理组 汉语言文学：最高分 529，最低分 504，省排名 71643”"""
+    lines = []
+    for row in rows:
+        name = f"{row['major']}({row['note']})" if row.get("note") else row["major"]
+        if row["is_overall"]:
+            name = f"整体录取分数线·{name}"
+        prefix = " ".join(part for part in (f"{row['year']}年", row["province"], row["admission_type"],
+                                            row["subject_group"]) if part)
+        scores = "，".join(f"{label} {row[field]}" for field, label in (
+            ("max_score", "最高分"), ("min_score", "最低分"), ("avg_score", "平均分"), ("province_rank", "省排名"))
+                          if row.get(field) is not None)
+        lines.append(f"{prefix} {name}：{scores}")
+    return "\n".join(lines)
+
+
+def get_score_line_stats() -> Dict[str, Any]:
+    index = _score_index
+    with _score_index_lock:
+        stats = dict(_lookup_stats)
+    stats["records"] = len(index.records)
+    stats["documents"] = len(index.records_by_entry)
+    stats["majors"] = len(index.by_major)
+    stats["years"] = index.years
+    return stats
@@ -0,0 +1,222 @@
+# vector_store.py
+# 本地稠密向量检索：用哈希字符 n-gram 在 CPU 上离线生成片段向量（无需联网、无需模型），
+# 向量矩阵保存为 .npy 文件并以内存映射方式加载，多个 uvicorn worker 共享操作系统页缓存中的同一份数据。
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+import time
+import zlib
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+    print("警告: 未安装 numpy，稠密向量检索不可用，将只使用关键词检索。")
+
+VECTOR_DIM = int(os.getenv("VECTOR_DIM", "512"))
+VECTOR_NGRAM_RANGE = (1, 3)
+VECTOR_INDEX_DIR = Path(os.getenv("VECTOR_INDEX_DIR", Path(__file__).resolve().parent / "vector_index"))
+POINTER_FILE_NAME = "current.json"
+
+_NORMALIZE_PATTERN = re.compile(r'[\s　，。！？；：、,.!?;:（）()《》“”"\'【】\[\]-]+')
+
+
+def embed_text(text: str) -> "np.ndarray":
+    """
+    哈希字符 n-gram 向量：每个 n-gram 经 crc32 映射到固定维度（另取一位哈希决定正负号以抵消碰撞），
+    词频取对数后做 L2 归一化。crc32 在所有进程中稳定，保证各 worker 算出相同的向量。
+    """
+    vector = np.zeros(VECTOR_DIM, dtype=np.float32)
+    normalized = _NORMALIZE_PATTERN.sub(" ", (text or "").lower())
+    grams: Counter = Counter()
+    for segment in normalized.split():
+        for n in range(VECTOR_NGRAM_RANGE[0], VECTOR_NGRAM_RANGE[1] + 1):
+            for i in range(len(segment) - n + 1):
+                grams[segment[i:i + n]] += 1
+    for gram, count in grams.items():
+        hashed = zlib.crc32(gram.encode("utf-8"))
+        sign = 1.0 if (hashed >> 31) & 1 == 0 else -1.0
+        vector[hashed % VECTOR_DIM] += sign * (1.0 + math.log(count))
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector /= norm
+    return vector
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+def chunk_fingerprint(chunks: List[Dict]) -> str:
+    """片段集合的指纹；与磁盘上的向量文件一致时无需重新计算"""
+    digest = hashlib.sha1()
+    for chunk in chunks:
+        digest.update(f"{chunk['knowledge_id']}:{chunk['chunk_index']}:{chunk['type']}:".encode("utf-8"))
+        digest.update(chunk["content"].encode("utf-8"))
+    digest.update(f"dim={VECTOR_DIM}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class VectorIndexState(NamedTuple):
+    """一个版本的向量索引；各字段必须一起替换，检索时一次性取出整个元组，避免读到新旧混合的状态"""
+    matrix: Any
+    keys: List[Tuple[int, int]]
+    knowledge_ids: Any
+    types: Any
+    hashes: List[str]  # 每行片段内容的哈希，增量重建时内容未变的片段直接复用已有向量
+    fingerprint: str
+
+
+class DenseVectorStore:
+    """
+    内存映射的向量矩阵。写入方生成新版本文件后原子替换指针文件；
+    读取方在每次检索前检查指针文件是否变化，变化时重新映射。
+    rebuild 的输入必须是所有 worker 共享的完整片段集合（knowledge_chunks 表），而不是某个进程内的局部数据。
+    """
+
+    def __init__(self, index_dir: Path = VECTOR_INDEX_DIR):
+        self.index_dir = Path(index_dir)
+        self._lock = threading.Lock()
+        self._pointer_mtime: Optional[float] = None
+        self._state: Optional[VectorIndexState] = None
+
+    @property
+    def available(self) -> bool:
+        return np is not None
+
+    @property
+    def fingerprint(self) -> Optional[str]:
+        state = self._state
+        return state.fingerprint if state else None
+
+    def _pointer_path(self) -> Path:
+        return self.index_dir / POINTER_FILE_NAME
+
+    def reload_if_changed(self):
+        if not self.available:
+            return
+        pointer_path = self._pointer_path()
+        try:
+            mtime = pointer_path.stat().st_mtime
+        except FileNotFoundError:
+            return
+        if mtime == self._pointer_mtime:
+            return
+        with self._lock:
+            if mtime == self._pointer_mtime:
+                return
+            try:
+                with open(pointer_path, "r", encoding="utf-8") as f:
+                    pointer = json.load(f)
+                matrix = np.load(self.index_dir / pointer["matrix_file"], mmap_mode="r")
+                keys = [tuple(key) for key in pointer["keys"]]
+                # 一次赋值发布新状态
+                self._state = VectorIndexState(
+                    matrix=matrix,
+                    keys=keys,
+                    knowledge_ids=np.asarray([key[0] for key in keys], dtype=np.int64),
+                    types=np.asarray(pointer["types"]),
+                    hashes=pointer.get("hashes") or [None] * len(keys),
+                    fingerprint=pointer["fingerprint"],
+                )
+                self._pointer_mtime = mtime
+            except Exception as e:
+                print(f"加载向量索引文件时发生错误: {e}")
+
+    def rebuild(self, chunks: List[Dict]):
+        """写出全部片段的新版本向量文件：只对新增或内容变化的片段计算向量；指纹未变化时跳过"""
+        if not self.available:
+            return
+        fingerprint = chunk_fingerprint(chunks)
+        self.reload_if_changed()
+        if fingerprint == self.fingerprint:
+            return
+
+        started = time.perf_counter()
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        state = self._state
+        previous_rows = {}
+        if state is not None and state.matrix.shape[1:] == (VECTOR_DIM,):
+            previous_rows = {digest: row for row, digest in enumerate(state.hashes) if digest}
+        hashes = [content_hash(chunk["content"]) for chunk in chunks]
+        matrix = np.zeros((len(chunks), VECTOR_DIM), dtype=np.float32)
+        embedded = 0
+        for row, (chunk, digest) in enumerate(zip(chunks, hashes)):
+            previous_row = previous_rows.get(digest)
+            if previous_row is not None:
+                matrix[row] = state.matrix[previous_row]
+            else:
+                matrix[row] = embed_text(chunk["content"])
+                embedded += 1
+
+        version = f"{int(time.time() * 1000)}-{os.getpid()}"
+        matrix_file = f"chunk_vectors.{version}.npy"
+        tmp_matrix_path = self.index_dir / f"{matrix_file}.tmp"
+        with open(tmp_matrix_path, "wb") as f:
+            np.save(f, matrix)
+        os.replace(tmp_matrix_path, self.index_dir / matrix_file)
+
+        pointer = {
+            "version": version,
+            "fingerprint": fingerprint,
+            "matrix_file": matrix_file,
+            "keys": [[chunk["knowledge_id"], chunk["chunk_index"]] for chunk in chunks],
+            "types": [chunk["type"] for chunk in chunks],
+            "hashes": hashes,
+        }
+        tmp_pointer_path = self.index_dir / f"{POINTER_FILE_NAME}.tmp.{os.getpid()}"
+        with open(tmp_pointer_path, "w", encoding="utf-8") as f:
+            json.dump(pointer, f, ensure_ascii=False)
+        os.replace(tmp_pointer_path, self._pointer_path())
+        self.reload_if_changed()
+        self._cleanup_old_versions(keep=matrix_file)
+        print(f"向量索引已重建：{len(chunks)} 个片段（新计算 {embedded} 个），耗时 {time.perf_counter() - started:.2f}s。")
+
+    def _cleanup_old_versions(self, keep: str):
+        for path in self.index_dir.glob("chunk_vectors.*.npy"):
+            if path.name == keep:
+                continue
+            try:
+                path.unlink()
+            except OSError:
+                # 其他进程仍在映射旧文件时（Windows）删除会失败，留待下次清理
+                pass
+
+    def search(self, query: str, top_k: int = 5, types: Optional[Iterable[str]] = None,
+               knowledge_ids: Optional[Iterable[int]] = None) -> List[Tuple[Tuple[int, int], float]]:
+        """向量化 top-k 余弦相似度检索，返回 [((knowledge_id, chunk_index), score), ...]"""
+        if not self.available:
+            return []
+        self.reload_if_changed()
+        state = self._state
+        if state is None or not state.keys:
+            return []
+        matrix, keys = state.matrix, state.keys
+
+        scores = matrix @ embed_text(query)
+        mask = np.ones(len(keys), dtype=bool)
+        if knowledge_ids is not None:
+            mask &= np.isin(state.knowledge_ids, list(knowledge_ids))
+        if types is not None:
+            mask &= np.isin(state.types, list(types))
+        scores = np.where(mask, scores, -np.inf)
+
+        top_k = min(top_k, int(mask.sum()))
+        if top_k <= 0:
+            return []
+        candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+        ranked = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(keys[row], float(scores[row])) for row in ranked if scores[row] > 0]
+
+
+_vector_store = DenseVectorStore()
+
+
+def get_vector_store() -> DenseVectorStore:
+    return _vector_store